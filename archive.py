@@ -0,0 +1,177 @@
+# archive.py
+import argparse
+import os
+import sqlite3
+from datetime import date
+from urllib.parse import quote
+
+from dietary import DIETARY_TAGS
+
+# The scheduled workflow downloads this file from the menu-archive release
+# before the run and uploads it again afterwards; .cache alone is not durable
+ARCHIVE_PATH = ".cache/menu_history.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS menu_items (
+    id INTEGER PRIMARY KEY,
+    restaurant TEXT NOT NULL,
+    date TEXT NOT NULL,
+    weekday TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    item TEXT NOT NULL,
+    UNIQUE (restaurant, date, position)
+);
+CREATE INDEX IF NOT EXISTS idx_menu_items_date ON menu_items (date);
+
+CREATE TABLE IF NOT EXISTS item_tags (
+    item_id INTEGER NOT NULL REFERENCES menu_items (id) ON DELETE CASCADE,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (item_id, tag)
+);
+CREATE INDEX IF NOT EXISTS idx_item_tags_tag ON item_tags (tag, item_id);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS menu_items_fts USING fts5(
+    item, content='menu_items', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS menu_items_ai AFTER INSERT ON menu_items BEGIN
+    INSERT INTO menu_items_fts (rowid, item) VALUES (new.id, new.item);
+END;
+CREATE TRIGGER IF NOT EXISTS menu_items_ad AFTER DELETE ON menu_items BEGIN
+    INSERT INTO menu_items_fts (menu_items_fts, rowid, item) VALUES ('delete', old.id, old.item);
+END;
+"""
+
+
+def connect(path=ARCHIVE_PATH):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def connect_readonly(path=ARCHIVE_PATH):
+    """Connection for queries, which never creates the file or its directory."""
+    return sqlite3.connect(f"file:{quote(os.path.abspath(path))}?mode=ro", uri=True)
+
+
+# -----------------------------------
+# ARCHIVE STAGE
+# -----------------------------------
+
+def archive_feed(feed, day, weekday, path=ARCHIVE_PATH):
+    """Store the day's menu items, replacing any earlier run for the same restaurant and date.
+
+    Restaurants whose menu was not found or failed to fetch are skipped, so a bad
+    rerun does not erase a menu archived earlier that day.
+    """
+    iso_day = day.isoformat()
+    stored = 0
+    with connect(path) as conn:
+        for entry in feed:
+            menu = entry["menu"]
+            if not menu.ok:
+                continue
+            conn.execute("DELETE FROM menu_items WHERE restaurant = ? AND date = ?", (entry["name"], iso_day))
+            for position, (line, tags) in enumerate(zip(menu.items, menu.tags)):
+                cur = conn.execute(
+                    "INSERT INTO menu_items (restaurant, date, weekday, position, item) VALUES (?, ?, ?, ?, ?)",
+                    (entry["name"], iso_day, weekday, position, line),
+                )
+                conn.executemany(
+                    "INSERT INTO item_tags (item_id, tag) VALUES (?, ?)",
+                    [(cur.lastrowid, tag) for tag in tags],
+                )
+                stored += 1
+    conn.close()
+    return stored
+
+
+# -----------------------------------
+# QUERIES
+# -----------------------------------
+
+def _fts_query(text):
+    # Every word must appear, each as a prefix ("bao bun" matches "Bao ban buffet")
+    return " ".join('"' + word.replace('"', '""') + '"*' for word in text.split())
+
+
+def search(conn, text, restaurant=None, limit=20):
+    sql = ("SELECT m.date, m.weekday, m.restaurant, m.item FROM menu_items_fts f "
+           "JOIN menu_items m ON m.id = f.rowid WHERE menu_items_fts MATCH ?")
+    params = [_fts_query(text)]
+    if restaurant:
+        sql += " AND m.restaurant LIKE ?"
+        params.append(f"%{restaurant}%")
+    sql += " ORDER BY m.date DESC, m.restaurant, m.position LIMIT ?"
+    params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def by_tag(conn, tag, day=None, limit=50):
+    sql = ("SELECT m.date, m.weekday, m.restaurant, m.item FROM item_tags t "
+           "JOIN menu_items m ON m.id = t.item_id WHERE t.tag = ?")
+    params = [DIETARY_TAGS.get(tag.upper(), tag.upper())]
+    if day:
+        sql += " AND m.date = ?"
+        params.append(day)
+    sql += " ORDER BY m.date DESC, m.restaurant, m.position LIMIT ?"
+    params.append(limit)
+    return conn.execute(sql, params).fetchall()
+
+
+def on_day(conn, day, restaurant=None):
+    sql = "SELECT date, weekday, restaurant, item FROM menu_items WHERE date = ?"
+    params = [day]
+    if restaurant:
+        sql += " AND restaurant LIKE ?"
+        params.append(f"%{restaurant}%")
+    sql += " ORDER BY restaurant, position"
+    return conn.execute(sql, params).fetchall()
+
+
+# -----------------------------------
+# CLI
+# -----------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the lunch menu history.")
+    parser.add_argument("--db", default=ARCHIVE_PATH)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("search", help="full-text search over menu items, newest first")
+    p.add_argument("text")
+    p.add_argument("--restaurant")
+    p.add_argument("--limit", type=int, default=20)
+
+    p = sub.add_parser("tag", help="items carrying a dietary tag such as VE or G")
+    p.add_argument("tag")
+    p.add_argument("--date", help="YYYY-MM-DD")
+    p.add_argument("--limit", type=int, default=50)
+
+    p = sub.add_parser("day", help="everything archived for one date")
+    p.add_argument("date", nargs="?", default=date.today().isoformat(), help="YYYY-MM-DD")
+    p.add_argument("--restaurant")
+
+    args = parser.parse_args()
+    if not os.path.isfile(args.db):
+        parser.error(f"no menu archive at {args.db}; generate_feed.py runs write it")
+    conn = connect_readonly(args.db)
+    try:
+        if args.command == "search":
+            rows = search(conn, args.text, args.restaurant, args.limit)
+        elif args.command == "tag":
+            rows = by_tag(conn, args.tag, args.date, args.limit)
+        else:
+            rows = on_day(conn, args.date, args.restaurant)
+    except sqlite3.DatabaseError as e:
+        parser.error(f"cannot read the menu archive {args.db}: {e}")
+    for day, weekday, restaurant, item in rows:
+        print(f"{day} {weekday:<11} {restaurant:<20} {item}")
+    if not rows:
+        print("No matching menu items.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+# benchmark.py
+import argparse
+import collections
+import contextlib
+import io
+import itertools
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+from bs4 import BeautifulSoup
+
+import generate_feed
+from generate_feed import (WEEKDAYS, build_feed, feed_meta, fetch_html, make_soup, parse_latency, parse_menu,
+                           parse_rate, parser_backend, parse_scope, save_feed)
+from recording import FetchReplay
+from restaurants import default_catalog, load_restaurants
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(HERE, "fixtures")
+# Menu items each fixture must parse to, per weekday; null where no menu is found
+EXPECTED_PATH = os.path.join(FIXTURE_DIR, "expected.json")
+
+# Modules the cheap commands (render, --help) must not import
+HEAVY_MODULES = ("requests", "urllib3", "bs4", "lxml", "multiprocessing", "sqlite3")
+
+# Fresh-interpreter startups timed by --startup; "python" alone is the baseline
+STARTUP_COMMANDS = [
+    ("python", ["-c", "pass"]),
+    ("import generate_feed", ["-c", "import generate_feed"]),
+    ("generate_feed.py --help", ["generate_feed.py", "--help"]),
+]
+
+# Stop words of the Persilja-style div_snippet pages
+SPECIALS = ["ERIKOIS", "ERIKOIS LOUNAS", "ERIKOISLOUNAS", "ERIKOIS ANNOS"]
+
+# Recorded pages for each parser path: (label, fixture file, catalog-style entry).
+FIXTURES = [
+    ("table", "table.html", {"parser": "table"}),
+    ("list", "list.html", {"parser": "list"}),
+    ("div_snippet", "div_snippet.html",
+     {"parser": "div_snippet", "options": {"div_snippet": {"stop_after": SPECIALS}}}),
+    ("simple_p", "simple_p.html", {"parser": "simple_p"}),
+    ("location", "makiata_lauttasaari.html",
+     {"parser": "location", "options": {"location": {"heading": "Lauttasaari"}}}),
+    ("persilja_alternate", "persilja_alternate.html",
+     {"parser": "div_snippet", "fallbacks": ["persilja_alternate"],
+      "options": {"div_snippet": {"stop_after": SPECIALS}}}),
+    ("casamare_fallback", "casamare_fallback.html",
+     {"parser": "first_table_row", "fallbacks": ["casamare_fallback"]}),
+]
+
+
+# -----------------------------------
+# MEASUREMENT
+# -----------------------------------
+
+def measure(fn, repeat):
+    """Median wall time (ms) over `repeat` calls and peak traced memory (KiB) of one call."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(times), peak / 1024
+
+
+def compare_backends(restaurant, html_text, repeat=5):
+    """Full html.parser tree versus the restaurant's configured backend and scope."""
+    baseline_ms, baseline_kib = measure(lambda: BeautifulSoup(html_text, "html.parser"), repeat)
+    tuned_ms, tuned_kib = measure(lambda: make_soup(restaurant, html_text), repeat)
+    day = WEEKDAYS[0]
+    same = (parse_menu(restaurant, BeautifulSoup(html_text, "html.parser"), day)
+            == parse_menu(restaurant, make_soup(restaurant, html_text), day))
+    return {
+        "name": restaurant["name"],
+        "backend": parser_backend(restaurant),
+        "scoped": parse_scope(restaurant) is not None,
+        "bytes": len(html_text.encode("utf-8")),
+        "baseline_ms": baseline_ms,
+        "baseline_kib": baseline_kib,
+        "tuned_ms": tuned_ms,
+        "tuned_kib": tuned_kib,
+        "same_menu": same,
+    }
+
+
+def load_fixture(filename):
+    with open(os.path.join(FIXTURE_DIR, filename), encoding="utf-8") as f:
+        return f.read()
+
+
+def fixture_restaurant(label, restaurant):
+    return dict(restaurant, name=f"bench:{label}")
+
+
+def menu_items(menu):
+    return list(menu.items) if menu.ok else None
+
+
+def fixture_menus():
+    """Label -> weekday -> menu items parsed from each fixture, None where no menu is found."""
+    menus = {}
+    for label, filename, restaurant in FIXTURES:
+        restaurant = fixture_restaurant(label, restaurant)
+        html_text = load_fixture(filename)
+        menus[label] = {day: menu_items(parse_menu(restaurant, make_soup(restaurant, html_text), day))
+                        for day in WEEKDAYS.values()}
+    return menus
+
+
+def load_expected():
+    with open(EXPECTED_PATH, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def check_fixtures(expected):
+    """Lines describing every fixture and weekday whose parsed menu differs from `expected`."""
+    problems = []
+    for label, days in fixture_menus().items():
+        for day, items in days.items():
+            want = expected.get(label, {}).get(day)
+            if items != want:
+                problems.append(f"{label} {day}: expected {want}, parsed {items}")
+    return problems
+
+
+def synthetic_page(html_text, scale):
+    """Pad a fixture with `scale` filler blocks ahead of the menu to grow the page."""
+    if scale <= 1:
+        return html_text
+    filler = "".join(
+        f'<div class="filler"><p>Tervetuloa lounaalle {i}</p><img src="/img/{i}.jpg" alt="">'
+        f'<a href="/n/{i}">Lue lisää</a></div>\n'
+        for i in range(scale)
+    )
+    m = re.search(r"<body[^>]*>", html_text)
+    if not m:
+        return filler + html_text
+    return html_text[:m.end()] + filler + html_text[m.end():]
+
+
+def benchmark_fixture(label, restaurant, html_text, day, repeat):
+    """Soup build plus parser chain for one page: throughput, latency percentiles and peak memory."""
+    restaurant = fixture_restaurant(label, restaurant)
+
+    def run():
+        return parse_menu(restaurant, make_soup(restaurant, html_text), day)
+
+    menu = run()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append((time.perf_counter() - start) * 1000)
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "label": label,
+        "bytes": len(html_text.encode("utf-8")),
+        "pages_per_s": 1000 / statistics.mean(samples),
+        "p50": cuts[49],
+        "p95": cuts[94],
+        "p99": cuts[98],
+        "peak_kib": peak / 1024,
+        "found": menu.ok,
+        "items": menu_items(menu),
+    }
+
+
+def run_fixture_benchmarks(day, repeat, scales, expected):
+    """Benchmark every fixture at every scale; each row records whether its menu is the `expected` one."""
+    rows = []
+    for label, filename, restaurant in FIXTURES:
+        html_text = load_fixture(filename)
+        for scale in scales:
+            row = benchmark_fixture(label, restaurant, synthetic_page(html_text, scale), day, repeat)
+            row["scale"] = scale
+            row["expected"] = row["items"] == expected.get(label, {}).get(day)
+            rows.append(row)
+    return rows
+
+
+def print_fixture_report(rows):
+    print(f"{'parser':<20} {'scale':>5} {'KiB in':>8} {'pages/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'peak KiB':>9}  menu")
+    for r in rows:
+        print(f"{r['label']:<20} {r['scale']:>5} {r['bytes'] / 1024:>8.1f} {r['pages_per_s']:>9.1f} "
+              f"{r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} {r['peak_kib']:>9.0f}  "
+              f"{'found' if r['found'] else 'NOT FOUND'}{'' if r['expected'] else ', NOT AS EXPECTED'}")
+
+
+def print_backend_report(rows):
+    print(f"{'restaurant':<16} {'backend':<12} {'scoped':<6} {'KiB in':>7} "
+          f"{'ms full':>8} {'ms tuned':>8} {'saved':>6} {'KiB full':>9} {'KiB tuned':>9} {'saved':>6}  menu")
+    for r in rows:
+        time_saved = 1 - r["tuned_ms"] / r["baseline_ms"] if r["baseline_ms"] else 0
+        mem_saved = 1 - r["tuned_kib"] / r["baseline_kib"] if r["baseline_kib"] else 0
+        print(f"{r['name']:<16} {r['backend']:<12} {'yes' if r['scoped'] else 'no':<6} "
+              f"{r['bytes'] / 1024:>7.1f} {r['baseline_ms']:>8.2f} {r['tuned_ms']:>8.2f} {time_saved:>6.0%} "
+              f"{r['baseline_kib']:>9.0f} {r['tuned_kib']:>9.0f} {mem_saved:>6.0%}  "
+              f"{'same' if r['same_menu'] else 'DIFFERS'}")
+
+
+# -----------------------------------
+# STARTUP
+# -----------------------------------
+
+def measure_startup(repeat):
+    """Median wall time (ms) of each STARTUP_COMMANDS entry in a fresh interpreter."""
+    rows = []
+    for label, args in STARTUP_COMMANDS:
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, *args], cwd=HERE, check=True, stdout=subprocess.DEVNULL)
+            times.append((time.perf_counter() - start) * 1000)
+        rows.append((label, statistics.median(times)))
+    probe = "import sys, generate_feed; print(' '.join(m for m in %r if m in sys.modules))" % (HEAVY_MODULES,)
+    heavy = subprocess.run([sys.executable, "-c", probe], cwd=HERE, check=True,
+                           capture_output=True, text=True).stdout.split()
+    return rows, heavy
+
+
+def print_startup_report(rows, heavy):
+    baseline = rows[0][1]
+    print(f"{'startup':<26} {'ms':>8} {'over python':>12}")
+    for label, ms in rows:
+        print(f"{label:<26} {ms:>8.1f} {ms - baseline:>12.1f}")
+    print(f"heavy modules loaded by import: {', '.join(heavy) or 'none'}")
+
+
+# -----------------------------------
+# LOAD TEST
+# -----------------------------------
+
+def scaled_catalog(catalog, count):
+    """`count` entries cycling through `catalog`, each with its own name and URL.
+
+    The URLs only differ by a fragment, which FetchReplay ignores, so every
+    copy is served its original's recorded page.
+    """
+    return [dict(r, name=f"{r['name']} #{i + 1}", url=f"{r['url']}#load-{i + 1}")
+            for i, r in enumerate(itertools.islice(itertools.cycle(catalog), count))]
+
+
+def run_load_test(archive, count, latency=None, error_rate=0.0, deadline=None, catalog=None):
+    """Time build_feed and save_feed end to end over a replayed catalog of `count` restaurants.
+
+    The restaurants are copies of `catalog` (restaurants.json by default),
+    which must be the catalog the archive was recorded with. Runs in a
+    scratch directory, so every state file starts empty and the parse stage
+    is not skipped by the weekly snapshot.
+    """
+    catalog = scaled_catalog(default_catalog() if catalog is None else catalog, count)
+    replay = generate_feed.fetch_replay = FetchReplay(archive, latency, error_rate)
+    # The copies share their original's host but stand in for distinct sites
+    generate_feed.PER_HOST_CONCURRENCY = generate_feed.MAX_CONCURRENCY
+    day = date.today()
+    metrics = []
+    retries = generate_feed.http_stats["retries"]
+    here = os.getcwd()
+    with tempfile.TemporaryDirectory() as scratch, contextlib.redirect_stdout(io.StringIO()):
+        os.chdir(scratch)
+        try:
+            start = time.perf_counter()
+            feed = build_feed(metrics, catalog, day, deadline=deadline)
+            built = time.perf_counter()
+            save_feed(feed, feed_meta(day))
+            saved = time.perf_counter()
+        finally:
+            os.chdir(here)
+    totals = sorted(m.get("total_ms", 0) for m in metrics)
+    cuts = statistics.quantiles(totals, n=100, method="inclusive") if len(totals) > 1 else totals * 99
+    return {
+        "restaurants": count,
+        "outcomes": dict(sorted(collections.Counter(m.get("outcome", "?") for m in metrics).items())),
+        "stale": sum(1 for m in metrics if m.get("stale")),
+        "build_s": built - start,
+        "save_s": saved - built,
+        "per_s": count / (saved - start),
+        "p50": cuts[49],
+        "p95": cuts[94],
+        "replay": dict(replay.stats, retries=generate_feed.http_stats["retries"] - retries),
+    }
+
+
+def print_load_report(row):
+    print(f"restaurants          {row['restaurants']}")
+    outcomes = ", ".join(f"{outcome} {n}" for outcome, n in row["outcomes"].items())
+    print(f"outcomes             {outcomes}, {row['stale']} stale")
+    print(f"build_feed           {row['build_s']:.2f} s")
+    print(f"save_feed            {row['save_s']:.2f} s")
+    print(f"throughput           {row['per_s']:.1f} restaurants/s")
+    print(f"finished after       p50 {row['p50']:.0f} ms, p95 {row['p95']:.0f} ms")
+    print("replay               {served} served, {injected} injected errors ({retries} retried), "
+          "{missing} not recorded".format(**row["replay"]))
+
+
+# -----------------------------------
+# CLI
+# -----------------------------------
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure restaurant page parsing.")
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per measurement")
+    parser.add_argument("--day", default=WEEKDAYS[0], help="weekday name to extract")
+    parser.add_argument("--scale", default="1,10,100,1000",
+                        help="comma-separated filler block counts for synthetic large pages")
+    parser.add_argument("--live", action="store_true",
+                        help="fetch the catalog and compare html.parser with the tuned backend and scope")
+    parser.add_argument("--write-expected", action="store_true",
+                        help="save the menus the fixtures parse to now as the expected ones")
+    parser.add_argument("--startup", action="store_true",
+                        help="time interpreter startup for generate_feed and list heavy modules it imports")
+    parser.add_argument("--load", type=int, metavar="N",
+                        help="run build_feed and save_feed over N restaurants served from --replay")
+    parser.add_argument("--replay", metavar="ARCHIVE", help="archive written by generate_feed.py --record")
+    parser.add_argument("--catalog",
+                        help="restaurant catalog JSON for --load and --live (default: restaurants.json)")
+    parser.add_argument("--latency", type=parse_latency, metavar="MS",
+                        help="delay each replayed response by MS milliseconds, or 'recorded'")
+    parser.add_argument("--errors", type=parse_rate, default=0.0, metavar="RATE",
+                        help="share of replayed requests answered with an injected 503, "
+                             "retried like real fetches")
+    parser.add_argument("--deadline", type=float, metavar="SECONDS", help="run deadline for the load test")
+    args = parser.parse_args()
+    if args.load is not None and not args.replay:
+        parser.error("--load needs a --replay archive")
+    try:
+        catalog = load_restaurants(args.catalog) if args.catalog else None
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+
+    if args.load is not None:
+        row = run_load_test(args.replay, args.load, args.latency, args.errors, args.deadline, catalog)
+        print_load_report(row)
+        generate_feed.exit_if_abandoned()
+        return
+
+    if args.startup:
+        print_startup_report(*measure_startup(args.repeat))
+        return
+
+    if args.write_expected:
+        with open(EXPECTED_PATH, "w", encoding="utf-8") as f:
+            json.dump(fixture_menus(), f, ensure_ascii=False, indent=1)
+            f.write("\n")
+        print(f"expected menus saved to {EXPECTED_PATH}")
+        return
+
+    if not args.live:
+        scales = [int(x) for x in args.scale.split(",") if x.strip()]
+        expected = load_expected()
+        rows = run_fixture_benchmarks(args.day, args.repeat, scales, expected)
+        print_fixture_report(rows)
+        problems = check_fixtures(expected)
+        problems += [f"{r['label']} {args.day} at scale {r['scale']}: parsed {r['items']}"
+                     for r in rows if not r["expected"]]
+        if problems:
+            sys.exit("parsed menus differ from " + EXPECTED_PATH + ":\n  " + "\n  ".join(problems))
+        return
+
+    rows = []
+    for r in catalog or default_catalog():
+        try:
+            html_text = fetch_html(r["url"])
+        except Exception as e:
+            print(f"{r['name']}: skipped ({e})")
+            continue
+        rows.append(compare_backends(r, html_text, args.repeat))
+    print_backend_report(rows)
+
+
+if __name__ == "__main__":
+    main()
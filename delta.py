@@ -0,0 +1,163 @@
+# delta.py
+import hashlib
+import html
+import json
+import os
+
+from menu import MenuResult
+
+DELTA_JSON_PATH = "delta.json"
+DELTA_XML_PATH = "delta.xml"
+DELTA_STATE_PATH = ".cache/delta_state.json"
+
+# The published files hold the changes numbered within the last DELTA_WINDOW
+# sequence numbers; a poller whose cursor is below their "since" reloads the feed
+DELTA_WINDOW = 100
+
+
+# -----------------------------------
+# SEQUENCE NUMBERS
+# -----------------------------------
+# Every time a restaurant's published menu changes it gets the next number of
+# one feed-wide sequence. Only the latest change per restaurant is kept, so the
+# changes since any cursor are simply the entries numbered above it. Every
+# restaurant's latest change is kept in DELTA_STATE_PATH. Without it the
+# published delta.json restarts the state: the cursor carries on, and the
+# restaurants outside its window are numbered once more.
+
+def load_sequences(path=DELTA_STATE_PATH, published=DELTA_JSON_PATH):
+    """(cursor, restaurant name -> latest change) as last saved, or (0, {})."""
+    for source in (path, published):
+        try:
+            with open(source, encoding="utf-8") as f:
+                data = json.load(f)
+            return data["seq"], {entry["name"]: entry for entry in data["restaurants"]}
+        except (OSError, ValueError, KeyError, TypeError):
+            continue
+    return 0, {}
+
+
+def change_hash(entry):
+    """Hash of what consumers see of a change.
+
+    Leaves out its number, the day it was published for and the stale menu's
+    timestamp, so a restaurant whose error or missing menu repeats every day
+    is not numbered again daily.
+    """
+    content = {k: v for k, v in entry.items() if k not in ("seq", "date", "day")}
+    if "menu" in content:
+        content["menu"] = {k: v for k, v in content["menu"].items() if k != "as_of"}
+    return hashlib.sha1(json.dumps(content, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def advance(cursor, entries, feed, meta):
+    """Number the restaurants whose menu differs from `entries`; return (cursor, entries, changed names).
+
+    Restaurants gone from the feed are kept as numbered "removed" entries so
+    pollers learn to drop them.
+    """
+    entries = dict(entries)
+    changed = []
+    current = set()
+    for item in feed:
+        current.add(item["name"])
+        entry = {
+            "name": item["name"],
+            "date": meta["date"],
+            "day": meta["day"],
+            "hours": item["hours"],
+            "prices": item["prices"],
+            "menu": item["menu"].to_dict(),
+        }
+        previous = entries.get(item["name"])
+        if previous is None or change_hash(previous) != change_hash(entry):
+            cursor += 1
+            entries[item["name"]] = {"seq": cursor, **entry}
+            changed.append(item["name"])
+    for name, entry in list(entries.items()):
+        if name not in current and not entry.get("removed"):
+            cursor += 1
+            entries[name] = {"seq": cursor, "name": name, "removed": True}
+            changed.append(name)
+    return cursor, entries, changed
+
+
+def changes_since(cursor, entries, since=0):
+    """(changes numbered above `since` in sequence order, the `since` applied, whether to start over).
+
+    A cursor ahead of the feed's own means the sequence was reset; the poller
+    then gets every restaurant again, as the changes since 0.
+    """
+    reset = since > cursor
+    if reset or since < 0:
+        since = 0
+    return sorted((e for e in entries.values() if e["seq"] > since), key=lambda e: e["seq"]), since, reset
+
+
+# -----------------------------------
+# RENDERING
+# -----------------------------------
+
+def render_json(cursor, entries, since=0):
+    changes, since, reset = changes_since(cursor, entries, since)
+    data = {"seq": cursor, "since": since}
+    if reset:
+        data["reset"] = True
+    data["restaurants"] = changes
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def render_xml(cursor, entries, since=0):
+    changes, since, reset = changes_since(cursor, entries, since)
+    reset_attr = ' reset="true"' if reset else ""
+    lines = ['<?xml version="1.0" encoding="UTF-8"?>\n',
+             f'<lunchDelta seq="{cursor}" since="{since}"{reset_attr}>\n']
+    for entry in changes:
+        if entry.get("removed"):
+            name = html.escape(entry["name"])
+            lines.append(f'  <removed seq="{entry["seq"]}"><name>{name}</name></removed>\n')
+            continue
+        lines.append(f'  <restaurant seq="{entry["seq"]}">\n')
+        lines.append(f"    <name>{html.escape(entry['name'])}</name>\n")
+        lines.append(f"    <date>{html.escape(entry['date'])}</date>\n")
+        lines.append(f"    <day>{html.escape(entry['day'] or '')}</day>\n")
+        if entry["hours"]:
+            lines.append(f"    <hours>{html.escape(entry['hours'])}</hours>\n")
+        for k, v in entry["prices"].items():
+            lines.append(f"    <price name='{html.escape(k)}'>{html.escape(v)}</price>\n")
+        menu = MenuResult.from_dict(entry["menu"])
+        attrs = f' status="{menu.status.value}"'
+        if menu.stale:
+            attrs += ' stale="true"' + (f' asOf="{html.escape(menu.as_of)}"' if menu.as_of else "")
+        lines.append(f"    <menu{attrs}><![CDATA[{menu.to_markdown()}]]></menu>\n")
+        lines.append("  </restaurant>\n")
+    lines.append("</lunchDelta>\n")
+    return "".join(lines)
+
+
+def _write(path, text):
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+
+def save_delta(feed, meta, json_path=DELTA_JSON_PATH, xml_path=DELTA_XML_PATH, state_path=DELTA_STATE_PATH):
+    """Number this run's changes and publish those of the last DELTA_WINDOW numbers; return the changed names.
+
+    The files are left untouched when nothing changed, so their cursor only
+    moves with real changes.
+    """
+    cursor, entries = load_sequences(state_path, json_path)
+    cursor, entries, changed = advance(cursor, entries, feed, meta)
+    if not changed and all(os.path.exists(p) for p in (json_path, xml_path, state_path)):
+        print(f"[delta] no menu changed; cursor stays at {cursor}")
+        return changed
+    _write(state_path, render_json(cursor, entries))
+    window = max(0, cursor - DELTA_WINDOW)
+    _write(json_path, render_json(cursor, entries, window))
+    _write(xml_path, render_xml(cursor, entries, window))
+    print(f"[delta] {len(changed)} change(s), cursor now {cursor}: {', '.join(changed) or '-'}")
+    return changed
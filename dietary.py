@@ -0,0 +1,64 @@
+# dietary.py
+import re
+
+# Allergen and diet markers as printed after dishes ("L,G", "VEG"), with aliases. Finnish
+# menus print VEG for vegaaninen, so it means vegan; K (kasvis) marks vegetarian dishes
+DIETARY_TAGS = {"L": "L", "VL": "VL", "G": "G", "M": "M", "K": "K", "VEG": "VE", "VE": "VE", "VGN": "VE",
+                "VEGAN": "VE"}
+_markers = "|".join(sorted(DIETARY_TAGS, key=len, reverse=True))
+# Case-insensitive, but not after a number, where "g" and "l" are grams and litres
+_dietary_tag_re = re.compile(r"(?i)(?<![\w-])(?<!\d )(" + _markers + r")(?![\w-])")
+_marker_list_re = re.compile(r"(?i)[\s,/()*]*(?:(?:" + _markers + r")(?![\w-])[\s,/()*]*)+")
+
+
+def dietary_tags(text):
+    """Normalized diet markers in a menu line, in order of first appearance."""
+    tags = []
+    for m in _dietary_tag_re.finditer(text):
+        tag = DIETARY_TAGS[m.group(1).upper()]
+        if tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def is_marker_list(text):
+    """Whether `text` holds nothing but diet markers, like the "G" or "L, G" left by splitting on commas."""
+    return bool(_marker_list_re.fullmatch(text))
+
+
+# -----------------------------------
+# TAG INDEX
+# -----------------------------------
+
+# Filtered feed variants: name -> tags of which an item needs at least one
+FILTERED_FEEDS = {
+    "vegan": ("VE",),
+    "vegetarian": ("K", "VE"),
+    "gluten-free": ("G",),
+}
+
+
+def tag_index(feed):
+    """Tag -> [(restaurant, item position)] over the menus of a built feed, from their stored tags."""
+    index = {}
+    for item in feed:
+        menu = item["menu"]
+        if not menu.ok:
+            continue
+        for position, tags in enumerate(menu.tags):
+            for tag in tags:
+                index.setdefault(tag, []).append((item["name"], position))
+    return index
+
+
+def filtered_feed(feed, index, tags):
+    """The feed narrowed to the menu items carrying any of `tags`, looked up in `index`.
+
+    Restaurants without such items are left out.
+    """
+    positions = {}
+    for tag in tags:
+        for name, position in index.get(tag, ()):
+            positions.setdefault(name, set()).add(position)
+    return [{**item, "menu": item["menu"].only(sorted(positions[item["name"]]))}
+            for item in feed if item["name"] in positions]
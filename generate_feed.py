@@ -1,10 +1,29 @@
 # generate_feed.py
-import requests
-from bs4 import BeautifulSoup
-from datetime import datetime
-from restaurants import restaurants
-import html
+from datetime import date, datetime, timezone
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from urllib.parse import urlsplit
+from restaurants import default_catalog, load_restaurants, shard
+from http_cache import HttpCache
+from health import SiteHealth
+from json_store import JsonStore, write_json
+from delta import save_delta
+from renderers import WRITERS, JsonWriter, XmlWriter, render_document
+from dietary import FILTERED_FEEDS, filtered_feed, is_marker_list, tag_index
+from menu import MENU_NOT_FOUND, MenuResult
+import argparse
+import codecs
+import glob
+import hashlib
+import functools
+import importlib.util
+import json
+import logging
+import os
 import re
+import sys
+import tempfile
+import threading
+import time
 
 # -----------------------------------
 # CONFIG
@@ -17,49 +36,550 @@ WEEKDAYS = {
     4: "Perjantai"
 }
 
-today_index = datetime.today().weekday()
-today_name = WEEKDAYS.get(today_index, "")
+# Concurrency limits for build_feed: total requests in flight, and in flight per host
+MAX_CONCURRENCY = 16
+PER_HOST_CONCURRENCY = 2
+
+# Seconds build_feed waits for fetching and parsing before publishing what has
+# finished; late and failed restaurants fall back to the day's last good menu
+RUN_DEADLINE = 45
+
+# Set by build_feed when it returned with fetches or parses still running;
+# exit_if_abandoned then ends the process without waiting for them
+abandoned_work = False
+
+# Processes for the HTML parsing stage of build_feed; 1 parses in the fetch threads
+PARSE_WORKERS = os.cpu_count() or 1
+
+# Shared HTTP client: separate connect/read timeouts (seconds) and retries with
+# jittered exponential backoff on connection errors, timeouts and 5xx responses
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 10
+FETCH_RETRIES = 2
+RETRY_BACKOFF = 0.5
+RETRY_JITTER = 0.5
+
+# Pages are read in chunks of FETCH_CHUNK_BYTES and cut off after
+# FETCH_MAX_BYTES; a restaurant can lower the cap with "max_bytes" and stop
+# earlier with a "stop_at" regex matching the end of its menu region
+FETCH_CHUNK_BYTES = 16 * 1024
+FETCH_MAX_BYTES = 2 * 1024 * 1024
+
+# Each chunk is searched for "stop_at" together with this many characters read
+# before it, so the menu region the anchor matches must fit in that window
+ANCHOR_WINDOW = 256 * 1024
+
+# On-disk response cache, revalidated with If-None-Match/If-Modified-Since
+CACHE_DIR = ".cache/http"
+CACHE_MAX_BYTES = 20 * 1024 * 1024
+
+http_cache = HttpCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+# Record/replay of the fetch layer (recording.py), set up by --record and --replay:
+# a FetchRecorder keeping every response, or a FetchReplay serving them instead
+# of the network
+fetch_recorder = None
+fetch_replay = None
+
+# Per-restaurant fetch history. After BREAKER_THRESHOLD failed runs in a row a
+# site is skipped for BREAKER_COOLDOWN seconds, doubling with every further
+# failure up to BREAKER_MAX_COOLDOWN; the history also orders the fetches.
+# The cool-downs suit one run every BREAKER_RUN_INTERVAL seconds, the daily
+# workflow; server.py scales them to its refresh interval.
+HEALTH_PATH = ".cache/site_health.json"
+BREAKER_THRESHOLD = 3
+BREAKER_COOLDOWN = 20 * 3600
+BREAKER_MAX_COOLDOWN = 7 * 24 * 3600
+BREAKER_RUN_INTERVAL = 24 * 3600
+
+site_health = SiteHealth(HEALTH_PATH, threshold=BREAKER_THRESHOLD,
+                         cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN)
+
+# HTML parser backend for BeautifulSoup. A restaurant can override it with a
+# "backend" key; "lxml" falls back to the stdlib parser when not installed.
+HTML_PARSER = "lxml"
+
+# Menus for the whole week, parsed on the first run of the week; later runs reuse
+# them while the page content is unchanged and otherwise parse only their own day
+WEEKLY_SNAPSHOT_PATH = ".cache/weekly_menus.json"
+weekly_snapshot = JsonStore(WEEKLY_SNAPSHOT_PATH)
+
+# Chain pages whose location sections are kept while their entries are parsed
+SECTION_CACHE_SIZE = 8
+
+# Strategy that last found the menu per restaurant, valid while the page keeps
+# the same structure
+PARSER_MEMO_PATH = ".cache/parser_memo.json"
+parser_memo = JsonStore(PARSER_MEMO_PATH)
+
+# Content hashes of the last written outputs, and their rendered restaurant
+# blocks, one file per output format and render key
+MANIFEST_PATH = ".cache/feed_manifest.json"
+BLOCK_DIR = ".cache/blocks"
+
+# Feed variants with only the items carrying some diet markers (dietary.FILTERED_FEEDS),
+# one directory per variant, and the tag index they are rendered from
+FILTERED_DIR = "filtered"
+FILTERED_WRITERS = [XmlWriter, JsonWriter]
+
+# Per-restaurant timings of the last run, one JSON object per line
+METRICS_PATH = "metrics.jsonl"
+
+# Per-shard results written by --shard and combined by --merge
+SHARD_DIR = "shards"
+
+# Pages saved by the fetch command, and the parsed feed saved by parse and run
+# for the render command
+PAGES_PATH = ".cache/pages.json"
+FEED_STATE_PATH = ".cache/feed_state.json"
 
 
 # -----------------------------------
 # HELPERS
 # -----------------------------------
 
-def fetch_html(url):
-    resp = requests.get(url, timeout=10)
+def weekday_name(day):
+    """Finnish weekday name for a date; empty on weekends."""
+    return WEEKDAYS.get(day.weekday(), "")
+
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def host_slot(url):
+    """Semaphore limiting concurrent requests to the host of `url`."""
+    host = urlsplit(url).netloc.lower()
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(PER_HOST_CONCURRENCY)
+    return slot
+
+
+def submit_by_host(pool, groups, catalog, fn):
+    """Submit fn(group) for every URL group, at most PER_HOST_CONCURRENCY per host at a time.
+
+    The other groups of a busy host wait in a per-host queue instead of in
+    pool threads blocked on host_slot, so a host with many pages cannot hold
+    every thread while other hosts sit idle. Returns one future per group.
+    """
+    futures = [Future() for _ in groups]
+    queues = {}
+    for k, group in enumerate(groups):
+        queues.setdefault(urlsplit(catalog[group[0]]["url"]).netloc.lower(), []).append(k)
+    lock = threading.Lock()
+
+    def start_next(queue):
+        while True:
+            with lock:
+                if not queue:
+                    return
+                k = queue.pop(0)
+            if futures[k].set_running_or_notify_cancel():
+                break
+        try:
+            inner = pool.submit(fn, groups[k])
+        except RuntimeError as e:
+            # The pool was shut down after the deadline
+            futures[k].set_exception(e)
+            return
+        inner.add_done_callback(lambda done: finish(done, k, queue))
+
+    def finish(inner, k, queue):
+        if inner.cancelled():
+            futures[k].set_exception(CancelledError())
+        elif inner.exception() is not None:
+            futures[k].set_exception(inner.exception())
+        else:
+            futures[k].set_result(inner.result())
+        start_next(queue)
+
+    for queue in queues.values():
+        for _ in range(PER_HOST_CONCURRENCY):
+            start_next(queue)
+    return futures
+
+
+class _HttpStatsHandler(logging.Handler):
+    """Counts new connections and retries from urllib3's debug log records."""
+
+    def emit(self, record):
+        msg = str(record.msg)
+        with _http_stats_lock:
+            if msg.startswith("Starting new"):
+                http_stats["connections"] += 1
+            elif msg.startswith(("Retrying", "Incremented Retry")):
+                http_stats["retries"] += 1
+
+
+http_stats = {"requests": 0, "connections": 0, "retries": 0}
+_http_stats_lock = threading.Lock()
+_session = None
+_session_hosts = 0
+_session_lock = threading.Lock()
+
+
+def http_session(hosts=None):
+    """Session shared by all fetches, with keep-alive pools, retries and compression.
+
+    It keeps one connection pool per host for `hosts` hosts; a caller about to
+    fetch more hosts than the session was built for gets it rebuilt larger.
+    """
+    global _session, _session_hosts
+    with _session_lock:
+        if _session is not None and hosts is not None and hosts > _session_hosts:
+            _session.close()
+            _session = None
+        if _session is None:
+            _session_hosts = max(1, hosts or 0, _session_hosts)
+            # Imported here so commands that never fetch do not pay for requests
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util import make_headers
+
+            adapter = HTTPAdapter(
+                pool_connections=_session_hosts,
+                pool_maxsize=PER_HOST_CONCURRENCY,
+                max_retries=http_retry(),
+            )
+            session = requests.Session()
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            # gzip/deflate, plus br/zstd when the decoders are installed
+            session.headers.update(make_headers(accept_encoding=True))
+            count_http_events()
+            _session = session
+        return _session
+
+
+def http_retry():
+    """The urllib3 retry policy of the shared session."""
+    from urllib3.util import Retry
+
+    return Retry(
+        total=FETCH_RETRIES,
+        backoff_factor=RETRY_BACKOFF,
+        backoff_jitter=RETRY_JITTER,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset({"GET"}),
+        raise_on_status=False,
+    )
+
+
+def count_http_events():
+    """Feed urllib3's debug log into http_stats."""
+    urllib3_log = logging.getLogger("urllib3")
+    urllib3_log.setLevel(logging.DEBUG)
+    if not any(isinstance(h, _HttpStatsHandler) for h in urllib3_log.handlers):
+        urllib3_log.addHandler(_HttpStatsHandler())
+
+
+def replay_get(url):
+    """The replayed response for `url`, retried under http_retry like a fetch over the session.
+
+    Injected 5xx responses are retried with the session's backoff, and the
+    retries are counted in http_stats, so a replay exercises the same
+    retry path as a real run.
+    """
+    from urllib3.exceptions import MaxRetryError
+
+    count_http_events()
+    retry = http_retry()
+    while True:
+        resp = fetch_replay.get(url)
+        if not retry.is_retry("GET", resp.status_code):
+            return resp
+        try:
+            retry = retry.increment("GET", url)
+        except MaxRetryError:
+            return resp
+        retry.sleep()
+
+
+def http_get(url, headers=None):
+    """Start a GET; the body is left unread (stream=True) for read_page.
+
+    When replaying, the response comes from the archive. When recording, it
+    is read whole and kept, and sent without the conditional `headers` so the
+    archive gets full pages rather than 304s.
+    """
+    with _http_stats_lock:
+        http_stats["requests"] += 1
+    if fetch_replay is not None:
+        return replay_get(url)
+    if fetch_recorder is not None:
+        return fetch_recorder.record(url, lambda: http_session().get(
+            url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=True))
+    return http_session().get(url, headers=headers, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), stream=True)
+
+
+_content_charset_re = re.compile(r"charset=[\"']?([\w.:-]+)", re.IGNORECASE)
+_meta_charset_re = re.compile(rb"""<meta[^>]+charset\s*=\s*["']?([\w.:-]+)""", re.IGNORECASE)
+
+
+def page_encoding(resp, head):
+    """Charset from the Content-Type header, else from a <meta> tag in `head`, else UTF-8.
+
+    requests falls back to ISO-8859-1 for text/html without a charset, which
+    garbles the ä and ö of Finnish pages served as UTF-8.
+    """
+    m = _content_charset_re.search(resp.headers.get("Content-Type", "")) or _meta_charset_re.search(head)
+    if m:
+        name = m.group(1).decode("ascii", "replace") if isinstance(m.group(1), bytes) else m.group(1)
+        try:
+            return codecs.lookup(name).name
+        except LookupError:
+            pass
+    return "utf-8"
+
+
+@functools.lru_cache(maxsize=None)
+def anchor_matcher(pattern):
+    return re.compile(pattern)
+
+
+def read_page(resp, anchor=None, max_bytes=FETCH_MAX_BYTES, metrics=None):
+    """Read a streamed response chunk by chunk, decoding as it arrives.
+
+    Stops as soon as the regex `anchor` has matched, keeping the text up to the
+    end of the match, or once `max_bytes` of body have been read. Only the
+    last ANCHOR_WINDOW characters before each new chunk are searched again,
+    so finding the anchor stays linear in the page size. If a
+    `metrics` dict is given, it receives the bytes transferred (before content
+    decoding) and decoded, the peak KiB of page data held and, when reading
+    stopped early, why.
+    """
+    metrics = {} if metrics is None else metrics
+    matcher = anchor_matcher(anchor) if anchor else None
+    decoder = None
+    text = ""
+    received = peak = 0
+    stopped = None
+    for chunk in resp.iter_content(FETCH_CHUNK_BYTES):
+        if decoder is None:
+            encoding = page_encoding(resp, chunk)
+            # utf-8-sig also drops a byte order mark
+            decoder = codecs.getincrementaldecoder("utf-8-sig" if encoding == "utf-8" else encoding)("replace")
+        received += len(chunk)
+        searched = max(0, len(text) - ANCHOR_WINDOW)
+        text += decoder.decode(chunk)
+        peak = max(peak, sys.getsizeof(text) + len(chunk))
+        m = matcher.search(text, searched) if matcher else None
+        if m:
+            text, stopped = text[:m.end()], "anchor"
+            break
+        if received >= max_bytes:
+            stopped = "cap"
+            break
+    if stopped:
+        resp.close()
+    elif decoder is not None:
+        text += decoder.decode(b"", final=True)
+    metrics["bytes"] = resp.raw.tell()
+    metrics["decoded_bytes"] = received
+    metrics["peak_kib"] = round(peak / 1024, 1)
+    if stopped:
+        metrics["stopped"] = stopped
+    return text
+
+
+def fetch_html(url, metrics=None, anchor=None, max_bytes=FETCH_MAX_BYTES):
+    """Download a page, revalidating against the HTTP cache.
+
+    The body is streamed and stops early at `anchor` or `max_bytes`, see
+    read_page. If a `metrics` dict is given, it receives the time spent
+    waiting for a host slot, the fetch latency, the read_page figures and
+    whether the cached body was reused.
+    """
+    metrics = {} if metrics is None else metrics
+    # A page cut short is cached apart from the full page, per anchor and cap
+    cache_key = url
+    if anchor or max_bytes != FETCH_MAX_BYTES:
+        cache_key += "#bounded-" + hashlib.sha1(f"{anchor}|{max_bytes}".encode("utf-8")).hexdigest()[:12]
+    headers = http_cache.conditional_headers(cache_key)
+    queued = time.perf_counter()
+    body = text = None
+    with host_slot(url):
+        started = time.perf_counter()
+        resp = http_get(url, headers)
+        if resp.status_code == 304:
+            resp.close()
+            body = http_cache.load(cache_key)
+            if body is None:
+                # Cache entry vanished between the two calls: fetch in full
+                resp = http_get(url)
+        if body is None and resp.ok:
+            text = read_page(resp, anchor, max_bytes, metrics)
+        elif body is None:
+            resp.close()
+    metrics["queue_ms"] = round((started - queued) * 1000, 1)
+    metrics["fetch_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    metrics["status"] = resp.status_code
+    if body is not None:
+        metrics["bytes"] = 0
+        metrics["cache"] = "revalidated"
+        print(f"[cache] not modified, reusing stored page: {url}")
+        return body
+    metrics["cache"] = "miss"
     resp.raise_for_status()
-    return resp.text
+    http_cache.store(cache_key, text, resp.headers)
+    return text
+
+
+class CircuitOpen(Exception):
+    """The restaurant's circuit breaker is open, so its page was not fetched."""
+
+
+def fetch_page(entries, metrics=None):
+    """fetch_html for catalog entries sharing a URL, behind their circuit breaker.
+
+    The outcome is recorded in site_health for every entry. The download stops
+    at "stop_at" only when all entries use the same anchor, and is capped at
+    the largest "max_bytes" among them.
+    """
+    metrics = {} if metrics is None else metrics
+    name = entries[0]["name"]
+    until = site_health.open_until(name)
+    if until is not None:
+        metrics["breaker"] = "open"
+        failures = site_health.get(name)["consecutive_failures"]
+        raise CircuitOpen(f"skipped after {failures} failed fetches in a row, "
+                          f"next try after {time.strftime('%Y-%m-%d %H:%M', time.localtime(until))}")
+    anchors = {r.get("stop_at") for r in entries}
+    anchor = anchors.pop() if len(anchors) == 1 else None
+    max_bytes = max(r.get("max_bytes", FETCH_MAX_BYTES) for r in entries)
+    started = time.perf_counter()
+    try:
+        html_text = fetch_html(entries[0]["url"], metrics, anchor, max_bytes)
+    except Exception as e:
+        for r in entries:
+            site_health.record(r["name"], False, (time.perf_counter() - started) * 1000, str(e))
+        raise
+    for r in entries:
+        site_health.record(r["name"], True, (time.perf_counter() - started) * 1000)
+    return html_text
+
+
+def fetch_order(catalog):
+    """Catalog positions in fetch order, so slow and unreliable sites start first."""
+    return site_health.schedule([r["name"] for r in catalog], FETCH_RETRIES)
+
+
+def size_http_session(catalog):
+    """Size the shared session's connection pools for the hosts of `catalog` before fetching it."""
+    if fetch_replay is None:
+        http_session(len({urlsplit(r["url"]).netloc.lower() for r in catalog}))
+
+
+def fetch_groups(catalog):
+    """Catalog positions grouped by URL, so every page is fetched once per run.
+
+    Groups come in fetch_order of their slowest entry; positions within a group
+    in catalog order.
+    """
+    groups = {}
+    for i in fetch_order(catalog):
+        groups.setdefault(catalog[i]["url"], []).append(i)
+    return [sorted(group) for group in groups.values()]
+
+
+def split_menu_text(menu_text):
+    """Split a table cell into menu lines at line breaks and commas.
+
+    A fragment holding only diet markers ("Kananuudelit L, G") belongs to the
+    dish before it and is joined back onto it.
+    """
+    items = []
+    separator = ""
+    for part in re.split(r"(\n|,)", menu_text):
+        if part in ("\n", ","):
+            separator = part
+            continue
+        part = part.strip()
+        if not part:
+            continue
+        if items and is_marker_list(part):
+            items[-1] += (", " if separator == "," else " ") + part
+        else:
+            items.append(part)
+    return items
 
 
 def clean_menu_items(items):
-    """Format items into Markdown bullets with proper line breaks."""
-    cleaned = [line.strip() for line in items if line and line.strip()]
-    if not cleaned:
-        return "Menu not found"
-    return "".join(f"• {line}  \n" for line in cleaned)
+    """Strip the menu lines and drop empty ones; no lines means the menu was not found."""
+    return MenuResult.found(items)
+
+
+def _alternation(words):
+    # Longest first so overlapping words ("ERIKOIS", "ERIKOISLOUNAS") match at the same start
+    return "|".join(re.escape(w) for w in sorted(words, key=len, reverse=True))
+
+
+@functools.lru_cache(maxsize=None)
+def boundary_matcher(stop_after=()):
+    """Compiled alternation of the weekday names (case-sensitive) and stop words (case-insensitive)."""
+    days = _alternation(WEEKDAYS.values())
+    if not stop_after:
+        return re.compile(f"(?P<day>{days})")
+    return re.compile(f"(?P<day>{days})|(?P<stop>(?i:{_alternation(stop_after)}))")
+
+
+@functools.lru_cache(maxsize=None)
+def stop_matcher(stop_after):
+    return re.compile(f"(?i:{_alternation(stop_after)})")
+
+
+def scan_boundary(text, stop_after=None):
+    """One pass over `text`: (contains a weekday name, index of the first stop word or -1)."""
+    stop_idx = -1
+    for m in boundary_matcher(tuple(stop_after or ())).finditer(text):
+        if m.lastgroup == "day":
+            return True, stop_idx
+        if stop_idx == -1:
+            stop_idx = m.start()
+    return False, stop_idx
 
 
 def contains_stop(text, stop_after):
-    if not text or not stop_after:
-        return False
-    lower_text = text.lower()
-    return any(stop.lower() in lower_text for stop in stop_after)
+    return first_stop_index(text, stop_after) != -1
 
 
 def first_stop_index(text, stop_after):
-    lower_text = text.lower()
-    idxs = [lower_text.find(stop.lower()) for stop in (stop_after or []) if lower_text.find(stop.lower()) != -1]
-    return min(idxs) if idxs else -1
+    if not text or not stop_after:
+        return -1
+    m = stop_matcher(tuple(stop_after)).search(text)
+    return m.start() if m else -1
+
+
+# -----------------------------------
+# PARSER REGISTRY
+# -----------------------------------
+
+# Strategy name -> {"fn": parser, "scope": SoupStrainer arguments or None}.
+# Parsers that only read one kind of element declare a scope so the soup is
+# built from just that subtree; parsers that walk siblings or search the whole
+# text leave it None.
+PARSERS = {}
+
+
+def register_parser(name, scope=None):
+    """Register a parser strategy under `name` for use in restaurant parser chains."""
+    def decorator(fn):
+        PARSERS[name] = {"fn": fn, "scope": scope}
+        return fn
+    return decorator
 
 
 # -----------------------------------
-# PARSERS (unchanged)
+# PARSERS
 # -----------------------------------
 
+@register_parser("table", scope={"name": "table", "class_": "lunch-list-table"})
 def parse_table_menu(soup, today_name):
     table = soup.find("table", class_="lunch-list-table")
     if not table:
-        return "Menu not found"
+        return MENU_NOT_FOUND
     for row in table.find_all("tr"):
         cols = row.find_all("td")
         if not cols:
@@ -67,11 +587,12 @@ def parse_table_menu(soup, today_name):
         day_text = cols[0].get_text(" ", strip=True)
         if today_name.lower() in day_text.lower():
             menu_text = cols[1].get_text(separator="\n", strip=True)
-            items = [it.strip() for part in re.split(r"\n|,", menu_text) for it in [part] if it.strip()]
+            items = split_menu_text(menu_text)
             return clean_menu_items(items)
-    return "Menu not found"
+    return MENU_NOT_FOUND
 
 
+@register_parser("list", scope={"name": "li", "class_": "menu-group-item"})
 def parse_list_menu(soup, today_name):
     for li in soup.find_all("li", class_="menu-group-item"):
         heading = li.find(class_="food-item-heading")
@@ -79,13 +600,20 @@ def parse_list_menu(soup, today_name):
         if today_name.lower() in heading_text.lower():
             items = [p.get_text(" ", strip=True) for p in li.find_all("p") if p.get_text(strip=True)]
             return clean_menu_items(items)
-    return "Menu not found"
+    return MENU_NOT_FOUND
+
+
+DOCUMENT_WRAPPERS = {"html", "head", "body"}
 
 
+@register_parser("div_snippet")
 def parse_div_snippet(soup, today_name, stop_after=None):
     """For Persilja: stops before 'ERIKOIS...' section."""
     for p in soup.find_all():
-        if p.name and today_name in p.get_text(" ", strip=True):
+        # lxml wraps a snippet in <html><body>, which would match first and has no siblings
+        if p.name in DOCUMENT_WRAPPERS:
+            continue
+        if today_name in p.get_text(" ", strip=True):
             items = []
             sib = p.find_next_sibling()
             while sib:
@@ -93,10 +621,10 @@ def parse_div_snippet(soup, today_name, stop_after=None):
                 if not text:
                     sib = sib.find_next_sibling()
                     continue
-                if any(day in text for day in WEEKDAYS.values()):
+                has_day, idx = scan_boundary(text, stop_after)
+                if has_day:
                     break
-                if stop_after and contains_stop(text, stop_after):
-                    idx = first_stop_index(text, stop_after)
+                if idx != -1:
                     if idx > 0:
                         prefix = text[:idx].strip()
                         if prefix:
@@ -105,9 +633,10 @@ def parse_div_snippet(soup, today_name, stop_after=None):
                 items.append(text)
                 sib = sib.find_next_sibling()
             return clean_menu_items(items)
-    return "Menu not found"
+    return MENU_NOT_FOUND
 
 
+@register_parser("simple_p")
 def parse_simple_p(soup, today_name, stop_after=None):
     """For Pisara: stops before 'Lisätietoja allergeeneista'."""
     sections = soup.find_all("p")
@@ -121,10 +650,10 @@ def parse_simple_p(soup, today_name, stop_after=None):
             capture = True
             continue
         if capture:
-            if any(day in text for day in WEEKDAYS.values()):
+            has_day, idx = scan_boundary(text, stop_after)
+            if has_day:
                 break
-            if stop_after and contains_stop(text, stop_after):
-                idx = first_stop_index(text, stop_after)
+            if idx != -1:
                 if idx > 0:
                     prefix = text[:idx].strip()
                     if prefix:
@@ -135,67 +664,145 @@ def parse_simple_p(soup, today_name, stop_after=None):
 
 
 # -----------------------------------
-# MAKIATA SPECIAL (no date check)
+# CHAIN PAGES
 # -----------------------------------
+# A chain lists every location on one page, each under its own heading. The
+# page is split into sections once per soup and every location entry of the
+# catalog picks its own.
 
-def parse_makiata_lauttasaari(soup):
-    """Always pull Lauttasaari section (no week restriction)."""
-    header = soup.find(lambda tag: tag.name in ["h1", "h2", "h3", "h4", "h5"]
-                       and "lauttasaari" in tag.get_text(" ", strip=True).lower())
-    if header:
-        # Try the table under Lauttasaari
-        table = header.find_next("table", class_="lunch-list-table")
-        if table:
-            for row in table.find_all("tr"):
-                cols = row.find_all("td")
-                if not cols:
-                    continue
-                day_text = cols[0].get_text(" ", strip=True)
-                if today_name.lower() in day_text.lower():
-                    menu_text = cols[1].get_text(separator="\n", strip=True)
-                    items = [it.strip() for part in re.split(r"\n|,", menu_text) for it in [part] if it.strip()]
-                    return clean_menu_items(items)
-        # fallback: paragraphs
-        items = []
-        sib = header.find_next_sibling()
-        while sib:
-            text = sib.get_text(" ", strip=True)
-            if not text:
-                sib = sib.find_next_sibling()
+HEADINGS = ("h1", "h2", "h3", "h4", "h5")
+
+_section_cache = {}
+_section_cache_lock = threading.Lock()
+
+
+def split_sections(soup):
+    """Lowercased heading text -> {"heading", "level", "elements"} in document order.
+
+    A section holds every tag after its heading up to the next heading of the
+    same or a higher level, so a location keeps its sub-headings. The first
+    heading with a given text wins.
+    """
+    with _section_cache_lock:
+        cached = _section_cache.get(id(soup))
+        if cached is not None and cached[0] is soup:
+            return cached[1]
+    sections, open_sections = {}, []
+    for el in soup.descendants:
+        if el.name is None:
+            continue
+        if el.name in HEADINGS:
+            level = int(el.name[1])
+            while open_sections and open_sections[-1]["level"] >= level:
+                open_sections.pop()
+            for section in open_sections:
+                section["elements"].append(el)
+            section = {"heading": el, "level": level, "elements": []}
+            sections.setdefault(el.get_text(" ", strip=True).lower(), section)
+            open_sections.append(section)
+            continue
+        for section in open_sections:
+            section["elements"].append(el)
+    with _section_cache_lock:
+        # Keep the soup referenced so its id is not reused while cached
+        _section_cache[id(soup)] = (soup, sections)
+        while len(_section_cache) > SECTION_CACHE_SIZE:
+            del _section_cache[next(iter(_section_cache))]
+    return sections
+
+
+def forget_sections(soups):
+    with _section_cache_lock:
+        for soup in soups:
+            _section_cache.pop(id(soup), None)
+
+
+@register_parser("location")
+def parse_location(soup, today_name, heading, table_class="lunch-list-table", stop_after=None):
+    """One location of a chain page: the section under the first heading containing `heading`.
+
+    Reads today's row of a `table_class` table in the section, else the
+    paragraphs after the heading up to the next weekday or stop word.
+    """
+    wanted = heading.lower()
+    section = next((sec for text, sec in split_sections(soup).items() if wanted in text), None)
+    if section is None:
+        return MENU_NOT_FOUND
+
+    for table in section["elements"]:
+        if table.name != "table" or table_class not in (table.get("class") or []):
+            continue
+        for row in table.find_all("tr"):
+            cols = row.find_all("td")
+            if not cols:
                 continue
-            if any(x.lower() in text.lower() for x in ["haaga", "espoo", "otaniemi"]):
-                break
-            if any(day in text for day in WEEKDAYS.values()):
-                break
-            items.append(text)
-            sib = sib.find_next_sibling()
-        return clean_menu_items(items) if items else "Menu not found"
+            day_text = cols[0].get_text(" ", strip=True)
+            if today_name.lower() in day_text.lower():
+                menu_text = cols[1].get_text(separator="\n", strip=True)
+                items = split_menu_text(menu_text)
+                return clean_menu_items(items)
+        break
 
-    return "Menu not found"
+    # fallback: paragraphs
+    items = []
+    for sib in section["heading"].find_next_siblings():
+        if sib.name in HEADINGS and int(sib.name[1]) <= section["level"]:
+            break
+        text = sib.get_text(" ", strip=True)
+        if not text:
+            continue
+        has_day, idx = scan_boundary(text, stop_after)
+        if has_day or idx != -1:
+            break
+        items.append(text)
+    return clean_menu_items(items)
+
+
+@register_parser("makiata_lauttasaari")
+def parse_makiata_lauttasaari(soup, today_name):
+    """Always pull Lauttasaari section (no week restriction)."""
+    return parse_location(soup, today_name, "lauttasaari", stop_after=("haaga", "espoo", "otaniemi"))
 
 
 # -----------------------------------
-# DISPATCHER (special parsers for Persilja & Casa Mare)
+# SITE FALLBACKS (Persilja & Casa Mare)
 # -----------------------------------
 
+@register_parser("persilja_alternate")
 def parse_persilja_alternate(soup, today_name):
     """Alternate approach: search raw text, find today's block and trim at ERIKOIS variants."""
     content = soup.get_text("\n", strip=True)
     start = content.find(today_name)
     if start == -1:
-        return "Menu not found"
+        return MENU_NOT_FOUND
     section = content[start:]
     # cut at ERIKOIS variants
-    for stopword in ["ERIKOISANNOS", "ERIKOIS LOUNAS", "ERIKOISLOUNAS", "ERIKOIS"]:
-        pos = section.upper().find(stopword.upper())
-        if pos != -1:
-            section = section[:pos]
+    pos = first_stop_index(section, ("ERIKOISANNOS", "ERIKOIS LOUNAS", "ERIKOISLOUNAS", "ERIKOIS"))
+    if pos != -1:
+        section = section[:pos]
     lines = [ln.strip() for ln in section.split("\n") if ln.strip() and not ln.strip().startswith(today_name)]
     if not lines:
-        return "Menu not found"
+        return MENU_NOT_FOUND
     return clean_menu_items(lines)
 
 
+@register_parser("first_table_row")
+def parse_first_table_row(soup, today_name):
+    """Casa Mare: second cell of the first table row mentioning today_name."""
+    table = soup.find("table")
+    if not table:
+        return MENU_NOT_FOUND
+    for row in table.find_all("tr"):
+        if today_name in row.get_text(" ", strip=True):
+            tds = row.find_all("td")
+            if len(tds) > 1:
+                menu_text = tds[1].get_text(" ", strip=True)
+                items = split_menu_text(menu_text)
+                return clean_menu_items(items)
+    return MENU_NOT_FOUND
+
+
+@register_parser("casamare_fallback")
 def parse_casamare_fallback(soup, today_name):
     """Casa Mare fallback: search for elements mentioning today_name or weekday, gather next paras."""
     # search for paragraph or headings that mention the weekday or the date
@@ -213,7 +820,7 @@ def parse_casamare_fallback(soup, today_name):
                 target = p
                 break
     if not target:
-        return "Menu not found"
+        return MENU_NOT_FOUND
 
     items = []
     sib = target.find_next_sibling()
@@ -222,138 +829,1163 @@ def parse_casamare_fallback(soup, today_name):
         if not text:
             sib = sib.find_next_sibling()
             continue
-        if any(day in text for day in WEEKDAYS.values()):
-            break
-        # also stop at common footer words
-        if "hinnasto" in text.lower() or "osoite" in text.lower():
+        # stop at the next weekday or at common footer words
+        has_day, idx = scan_boundary(text, ("hinnasto", "osoite"))
+        if has_day or idx != -1:
             break
         items.append(text)
         sib = sib.find_next_sibling()
-    return clean_menu_items(items) if items else "Menu not found"
-
-
-def fetch_today_menu(restaurant, today_name):
-    html_text = fetch_html(restaurant["url"])
-    soup = BeautifulSoup(html_text, "html.parser")
-    type_ = restaurant.get("type", "")
-    name = restaurant.get("name", "").lower()
-    url = restaurant["url"].lower()
-
-    # Persilja: try dedicated parser first, then alternate if needed
-    if "persilja" in name or "persilja" in url:
-        # first try div_snippet style (keeps structure), then raw-text fallback
-        res = parse_div_snippet(soup, today_name, stop_after=["ERIKOIS", "ERIKOIS LOUNAS", "ERIKOISLOUNAS", "ERIKOIS ANNOS"])
-        if res == "Menu not found":
-            res = parse_persilja_alternate(soup, today_name)
-        return res
-
-    # Casa Mare: try table/div/p parsing, then fallback
-    if "casa" in name or "casamare" in url or "casa-mare" in url:
-        # try table/div approach from earlier version
-        # Try table rows first
-        table_try = None
-        table = soup.find("table")
-        if table:
-            for row in table.find_all("tr"):
-                if today_name in row.get_text(" ", strip=True):
-                    tds = row.find_all("td")
-                    if len(tds) > 1:
-                        table_try = tds[1].get_text(" ", strip=True)
-                        break
-        if table_try:
-            # split into items
-            items = [it.strip() for part in re.split(r"\n|,", table_try) for it in [part] if it.strip()]
-            return clean_menu_items(items)
-        # fallback paragraph/div approach
-        res = parse_casamare_fallback(soup, today_name)
-        return res
+    return clean_menu_items(items)
+
+
+# -----------------------------------
+# DISPATCHER
+# -----------------------------------
+
+def resolve_parser_chain(restaurant):
+    """Look up the restaurant's "parser" and "fallbacks" strategies in PARSERS.
+
+    Returns a tuple of (strategy name, parser, options) in the order they are
+    tried. Options come from the restaurant's "options" dict, keyed by strategy.
+    """
+    names = [restaurant.get("parser")] + list(restaurant.get("fallbacks", []))
+    unknown = [n for n in names if n not in PARSERS]
+    if unknown:
+        raise ValueError(f"{restaurant.get('name')}: unknown parser strategy {', '.join(map(str, unknown))}")
+    options = restaurant.get("options", {})
+    return tuple((n, PARSERS[n]["fn"], options.get(n, {})) for n in names)
+
+
+def resolve_parser_chains(catalog):
+    return {r["name"]: resolve_parser_chain(r) for r in catalog}
+
+
+# Filled by main from the catalog being run; other restaurants are resolved on first use
+PARSER_CHAINS = {}
+_parser_chains_lock = threading.Lock()
+
+
+def parser_chain(restaurant):
+    chain = PARSER_CHAINS.get(restaurant["name"])
+    if chain is None:
+        chain = resolve_parser_chain(restaurant)
+        with _parser_chains_lock:
+            PARSER_CHAINS[restaurant["name"]] = chain
+    return chain
+
+
+def parse_menu(restaurant, soup, today_name, metrics=None, first=None):
+    """Run the restaurant's parser chain; the first strategy that finds a menu wins.
+
+    `first` names a strategy of the chain to try before the others. If a
+    `metrics` dict is given, it records the strategy that produced the result,
+    how many strategies were tried and how many of those failed before it.
+    """
+    chain = parser_chain(restaurant)
+    if first is not None:
+        chain = sorted(chain, key=lambda link: link[0] != first)
+    res = MENU_NOT_FOUND
+    for attempt, (name, parser, options) in enumerate(chain, 1):
+        res = parser(soup, today_name, **options).with_parser(name)
+        if metrics is not None:
+            metrics["parser"] = name
+            metrics["attempts"] = attempt
+            metrics["wasted_parses"] = attempt - 1 if res.ok else 0
+        if res.ok:
+            break
+    return res
+
+
+# -----------------------------------
+# WEEKLY SNAPSHOT
+# -----------------------------------
+
+def iso_week(day=None):
+    year, week, _ = (day or date.today()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+
+_volatile_re = re.compile(r"<(script|style|noscript)\b.*?</\1\s*>|<!--.*?-->", re.IGNORECASE | re.DOTALL)
+
+
+def content_hash(html_text):
+    """Hash of a page without its scripts, styles and comments, and with whitespace collapsed.
+
+    Those are where WordPress and similar sites put nonces and build stamps
+    that change on every request.
+    """
+    return hashlib.sha1(" ".join(_volatile_re.sub("", html_text).split()).encode("utf-8")).hexdigest()
+
+
+# -----------------------------------
+# PARSER MEMO
+# -----------------------------------
+# Restaurant name -> {"fingerprint", "parsers", "parser"}: the strategy that
+# found the menu last time, tried first while the page structure and the
+# parser chain stay the same.
+
+_tag_re = re.compile(r"<([a-zA-Z][a-zA-Z0-9-]*)([^>]*)>")
+_class_re = re.compile(r"""\bclass\s*=\s*["']([^"']*)["']""", re.IGNORECASE)
+
+
+def page_fingerprint(html_text):
+    """Hash of the distinct tag and class pairs on the page.
+
+    Menu text and the number of repeated elements (one <p> per dish) change
+    daily; the set of element kinds only changes with the site's template.
+    """
+    kinds = set()
+    for m in _tag_re.finditer(html_text):
+        cls = _class_re.search(m.group(2))
+        kinds.add(f"{m.group(1).lower()}.{' '.join(sorted(cls.group(1).split())) if cls else ''}")
+    return hashlib.sha1("\n".join(sorted(kinds)).encode("utf-8")).hexdigest()
+
+
+def remembered_parser(restaurant, fingerprint):
+    """Strategy that worked on a page with this structure, or None when it would not change the order.
+
+    Single-strategy chains and chains whose first strategy is the remembered
+    one get None, so the parse metrics only count the memo where it helped.
+    """
+    parsers = [name for name, _, _ in parser_chain(restaurant)]
+    if len(parsers) < 2:
+        return None
+    memo = parser_memo.load().get(restaurant["name"])
+    if not memo or memo["parsers"] != parsers or memo["parser"] == parsers[0]:
+        return None
+    if memo["fingerprint"] != fingerprint:
+        print(f"[memo] page structure changed, trying the full parser chain: {restaurant['name']}")
+        return None
+    return memo["parser"]
+
+
+def remember_parser(restaurant, fingerprint, menus):
+    """Record the strategy that found today's menu, or failing that the one that worked on most days."""
+    winners = [menu.parser for menu in menus if menu.ok]
+    memo = parser_memo.load()
+    with parser_memo.lock:
+        if winners:
+            memo[restaurant["name"]] = {
+                "fingerprint": fingerprint,
+                "parsers": [name for name, _, _ in parser_chain(restaurant)],
+                "parser": winners[0] if menus[0].ok else max(set(winners), key=winners.count),
+            }
+        elif memo.get(restaurant["name"], {}).get("fingerprint") != fingerprint:
+            memo.pop(restaurant["name"], None)
 
-    # Makiata special
-    if "makiata" in url or "makiata" in name:
-        return parse_makiata_lauttasaari(soup)
 
-    # Default flows for the remaining restaurants
-    if type_ == "table":
-        return parse_table_menu(soup, today_name)
-    if type_ == "list":
-        return parse_list_menu(soup, today_name)
-    if type_ == "div_snippet":
-        return parse_div_snippet(soup, today_name)
-    if type_ == "simple_p":
-        return parse_simple_p(soup, today_name)
+# -----------------------------------
+# HTML PARSING
+# -----------------------------------
+
+def parser_backend(restaurant=None):
+    backend = (restaurant or {}).get("backend") or HTML_PARSER
+    if backend == "lxml" and importlib.util.find_spec("lxml") is None:
+        return "html.parser"
+    return backend
+
+
+@functools.lru_cache(maxsize=None)
+def scope_strainer(name):
+    """SoupStrainer for the scope of strategy `name`, or None if it has none."""
+    from bs4 import SoupStrainer
+    scope = PARSERS[name]["scope"]
+    return SoupStrainer(**scope) if scope else None
+
+
+def parse_scope(restaurant):
+    """Scope shared by every strategy in the chain, or None to parse the full page."""
+    names = [name for name, _, _ in parser_chain(restaurant)]
+    scopes = [PARSERS[name]["scope"] for name in names]
+    return scope_strainer(names[0]) if all(scope == scopes[0] for scope in scopes) else None
+
+
+def make_soup(restaurant, html_text, scoped=True):
+    """Build the soup for a restaurant page with its backend and, if any, its parse scope."""
+    from bs4 import BeautifulSoup
+    scope = parse_scope(restaurant) if scoped else None
+    return BeautifulSoup(html_text, parser_backend(restaurant), parse_only=scope)
+
+
+def parse_week(restaurant, soup, first=None, days=None):
+    """Extract the menu for every weekday, or only `days`, from one soup.
+
+    Returns the menus and, per weekday, the metrics of the strategy that produced it.
+    """
+    menus, used = {}, {}
+    for day in days or WEEKDAYS.values():
+        used[day] = {}
+        menus[day] = parse_menu(restaurant, soup, day, used[day], first)
+    return menus, used
+
+
+def snapshot_entry(restaurant, day):
+    """The restaurant's snapshot for the week of `day`, or None if it is from another week or parser chain."""
+    cached = weekly_snapshot.load().get(restaurant["name"])
+    if not cached or cached["week"] != iso_week(day) or "hashes" not in cached:
+        return None
+    if cached.get("parsers") != [name for name, _, _ in parser_chain(restaurant)]:
+        return None
+    return cached
+
+
+def snapshot_menu(restaurant, page_hash, day, metrics):
+    """The day's menu from the weekly snapshot if it was parsed from the same page content, else None."""
+    today_name = weekday_name(day)
+    cached = snapshot_entry(restaurant, day)
+    if not (cached and cached["hashes"].get(today_name) == page_hash
+            and isinstance(cached["menus"].get(today_name), dict)):
+        return None
+    print(f"[weekly] page unchanged, {today_name} menu from snapshot: {restaurant['name']}")
+    metrics.update(cached.get("used", {}).get(today_name, {}))
+    metrics["snapshot"] = True
+    metrics["parse_ms"] = 0.0
+    metrics["wasted_parses"] = 0
+    return MenuResult.from_dict(cached["menus"][today_name])
+
+
+def last_good_menu(restaurant, day):
+    """The day's menu from this week's snapshot, marked stale, whatever the page looks like now; or None."""
+    cached = weekly_snapshot.load().get(restaurant["name"])
+    if not cached or cached["week"] != iso_week(day):
+        return None
+    menu = cached["menus"].get(weekday_name(day))
+    if not isinstance(menu, dict) or menu["status"] != "ok":
+        return None
+    parsed_at = cached.get("parsed", {}).get(weekday_name(day), cached.get("parsed_at"))
+    return MenuResult.from_dict(menu).as_stale(parsed_at)
+
+
+def fallback_menu(restaurant, day, error, metrics):
+    """The last good menu for a restaurant that failed or ran out of time, else the error as a menu."""
+    metrics["error"] = str(error)
+    if isinstance(error, DeadlineExceeded):
+        metrics["deadline"] = "pending"
+    menu = last_good_menu(restaurant, day)
+    if menu is None:
+        return MenuResult.failed(error)
+    print(f"[stale] {restaurant['name']}: {error}; reusing the {weekday_name(day)} menu "
+          f"parsed {menu.as_of or 'earlier this week'}")
+    metrics["stale"] = True
+    return menu
+
+
+def store_week(restaurant, page_hash, day, menus, used):
+    """Add parsed menus to the week's snapshot, each with the hash of the page content it came from.
+
+    Menus of another week than the current one, parsed for --date, are not
+    stored: they would replace the entry the next regular run relies on.
+    """
+    if iso_week(day) != iso_week():
+        return
+    cached = snapshot_entry(restaurant, day)
+    entry = cached or {
+        "week": iso_week(day), "parsers": [name for name, _, _ in parser_chain(restaurant)],
+        "hashes": {}, "parsed": {}, "used": {}, "menus": {},
+    }
+    parsed_at = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    snapshot = weekly_snapshot.load()
+    with weekly_snapshot.lock:
+        for d, menu in menus.items():
+            entry["hashes"][d] = page_hash
+            entry["parsed"][d] = parsed_at
+            entry["used"][d] = used[d]
+            entry["menus"][d] = menu.to_dict()
+        snapshot[restaurant["name"]] = entry
+
 
-    return "Menu type unknown"
+def parse_page(entries, page, today_name, firsts, weeks, chains):
+    """Parse stage for one page shared by catalog entries, safe to run in a worker process.
+
+    `page` is the UTF-8 encoded HTML, `firsts` the strategy to try first for
+    each entry, `weeks` whether to parse the whole week for it or only today
+    and `chains` its parser chain as resolved by the caller. The soup is built
+    once per backend and parse scope and shared by the entries. Returns, per
+    entry, today's menu, the menus parsed by weekday (None outside
+    Monday-Friday), the strategies used per day and the parse metrics; or the
+    exception its parsers raised.
+    """
+    html_text = page.decode("utf-8")
+    soups, parsed = {}, []
+    try:
+        for restaurant, first, week, chain in zip(entries, firsts, weeks, chains):
+            started = time.perf_counter()
+            try:
+                # A worker's PARSER_CHAINS comes from the default catalog; take the caller's chain
+                if PARSER_CHAINS.get(restaurant["name"]) != chain:
+                    with _parser_chains_lock:
+                        PARSER_CHAINS[restaurant["name"]] = chain
+                key = (parser_backend(restaurant), parse_scope(restaurant))
+                if key not in soups:
+                    soups[key] = make_soup(restaurant, html_text)
+                metrics = {"snapshot": False, "memo": first is not None}
+                if today_name in WEEKDAYS.values():
+                    menus, used = parse_week(restaurant, soups[key], first, None if week else [today_name])
+                    menu = menus[today_name]
+                    metrics.update(used[today_name])
+                    metrics["wasted_parses"] = sum(u["wasted_parses"] for u in used.values())
+                else:
+                    menus, used = None, None
+                    menu = parse_menu(restaurant, soups[key], today_name, metrics, first)
+                metrics["parse_ms"] = round((time.perf_counter() - started) * 1000, 1)
+                parsed.append((menu, menus, used, metrics))
+            except Exception as e:
+                parsed.append(e)
+    finally:
+        forget_sections(soups.values())
+    return parsed
+
+
+def finish_parse(restaurant, page_hash, fingerprint, day, parsed, metrics):
+    if isinstance(parsed, Exception):
+        return parsed
+    menu, menus, used, parse_metrics = parsed
+    metrics.update(parse_metrics)
+    remember_parser(restaurant, fingerprint, [menu] + list((menus or {}).values()))
+    if menus is not None:
+        store_week(restaurant, page_hash, day, menus, used)
+    return menu
+
+
+class DeadlineExceeded(Exception):
+    """Fetching or parsing was still running when the run deadline passed."""
+
+
+def await_result(future, timeout):
+    """future.result(timeout), raising DeadlineExceeded if it has not finished in time."""
+    try:
+        return future.result(timeout)
+    except FuturesTimeout:
+        if future.done():
+            raise
+        raise DeadlineExceeded("not finished by the run deadline")
+
+
+def fetch_stage(entries, day, metrics, parse_pool=None, pages=None):
+    """Fetch a page once for the catalog entries sharing its URL and hand it to the parse stage.
+
+    Entries whose menu is in the weekly snapshot are answered from there; the
+    others are parsed together. With `pages` (restaurant name -> HTML, as
+    saved by the fetch command) the page is taken from there instead of
+    downloaded. `metrics` holds one dict per entry. Returns one MenuResult or
+    exception per entry, or with a `parse_pool` a callable that waits for the
+    worker, at most `timeout` seconds if given, and returns them.
+    """
+    if pages is None:
+        html_text = fetch_page(entries, metrics[0])
+        for m in metrics[1:]:
+            m["fetched_with"] = entries[0]["name"]
+    else:
+        html_text = next((pages[r["name"]] for r in entries if r["name"] in pages), None)
+        if html_text is None:
+            raise LookupError("no fetched page, run the fetch command first")
+    page = html_text.encode("utf-8")
+    page_hash = content_hash(html_text)
+    results = [snapshot_menu(r, page_hash, day, m) for r, m in zip(entries, metrics)]
+    todo = [k for k, menu in enumerate(results) if menu is None]
+    if not todo:
+        return results
+    fingerprint = page_fingerprint(html_text)
+    firsts = [remembered_parser(entries[k], fingerprint) for k in todo]
+    # The whole week is parsed once a week; a page that changed since only for today
+    weeks = [snapshot_entry(entries[k], day) is None for k in todo]
+    job = ([entries[k] for k in todo], page, weekday_name(day), firsts, weeks,
+           [parser_chain(entries[k]) for k in todo])
+
+    def finish(parsed):
+        for k, p in zip(todo, parsed):
+            results[k] = finish_parse(entries[k], page_hash, fingerprint, day, p, metrics[k])
+        return results
+
+    if parse_pool is None:
+        return finish(parse_page(*job))
+    future = parse_pool.submit(parse_page, *job)
+    return lambda timeout=None: finish(await_result(future, timeout))
+
+
+def fetch_today_menu(restaurant, day, metrics=None):
+    """The restaurant's menu for `day`, parsed inline. `metrics` receives fetch and parse timings if given."""
+    metrics = {} if metrics is None else metrics
+    menu = fetch_stage([restaurant], day, [metrics])[0]
+    if isinstance(menu, Exception):
+        raise menu
+    return menu
 
 
 # -----------------------------------
 # FEED GENERATION + SAVE
 # -----------------------------------
 
-def build_feed():
+def make_entry(r, menu, metrics):
+    metrics["outcome"] = menu.status.value
+    return {
+        "name": r["name"],
+        "hours": r.get("hours", ""),
+        "prices": r.get("prices", {}),
+        "menu": menu
+    }
+
+
+def build_entry(r, day, metrics=None):
+    """Fetch and parse one restaurant in the calling thread."""
+    metrics = {} if metrics is None else metrics
+    metrics["name"] = r["name"]
+    started = time.perf_counter()
+    try:
+        menu = fetch_today_menu(r, day, metrics)
+    except Exception as e:
+        menu = fallback_menu(r, day, e, metrics)
+    metrics["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return make_entry(r, menu, metrics)
+
+
+def parse_pool(size):
+    """Process pool for the parse stage, imported here as only build_feed needs it."""
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Fetch threads are running when the pool starts its workers, and forking a
+    # threaded process can copy held locks; start workers from a clean process.
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+    return ProcessPoolExecutor(max_workers=min(PARSE_WORKERS, size), mp_context=context)
+
+
+def build_feed(metrics=None, catalog=None, day=None, pages=None, deadline=None, preview=False):
+    """Fetch all restaurants concurrently and parse them in a process pool.
+
+    Each URL is fetched once on a thread pool (the I/O stage) and its page
+    parsed for every catalog entry sharing it on PARSE_WORKERS processes (the
+    CPU stage) as soon as it arrives. Fetches are started in fetch_groups
+    order, slowest first, but entries are collected in catalog order.
+
+    After `deadline` seconds (RUN_DEADLINE by default) the feed is built from
+    what has finished; restaurants still running or failed get the day's last
+    good menu, marked stale, where there is one. `catalog` defaults to
+    restaurants.json and `day` to today; `pages` replaces fetching with pages
+    saved earlier. If a `metrics` list is given, it is extended with one dict
+    per restaurant, in the same order. A `preview` leaves the weekly snapshot
+    on disk as it was.
+    """
+    catalog = default_catalog() if catalog is None else catalog
+    day = date.today() if day is None else day
+    per_restaurant = [{"name": r["name"]} for r in catalog]
+    started = time.perf_counter()
+    deadline_at = started + (RUN_DEADLINE if deadline is None else deadline)
+    groups = fetch_groups(catalog)
+    if pages is None:
+        size_http_session(catalog)
+    fetch_pool = ThreadPoolExecutor(max_workers=max(1, min(MAX_CONCURRENCY, len(groups))))
+    pool = parse_pool(len(groups)) if min(PARSE_WORKERS, len(groups)) > 1 else None
+    results = [None] * len(catalog)
+    pending = []
+    try:
+        stages = submit_by_host(fetch_pool, groups, catalog, lambda group: fetch_stage(
+            [catalog[i] for i in group], day, [per_restaurant[i] for i in group], pool, pages))
+        for group, stage in zip(groups, stages):
+            try:
+                menus = await_result(stage, max(0.0, deadline_at - time.perf_counter()))
+                if callable(menus):
+                    menus = menus(max(0.0, deadline_at - time.perf_counter()))
+            except Exception as e:
+                menus = [e] * len(group)
+                if isinstance(e, DeadlineExceeded):
+                    pending += [catalog[i]["name"] for i in group]
+            for i, menu in zip(group, menus):
+                results[i] = menu
+                per_restaurant[i]["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    finally:
+        # Work still running past the deadline is abandoned, not waited for
+        fetch_pool.shutdown(wait=not pending, cancel_futures=True)
+        if pool is not None:
+            pool.shutdown(wait=not pending, cancel_futures=True)
+    if pending:
+        global abandoned_work
+        abandoned_work = True
+        print(f"[deadline] {len(pending)} restaurant(s) not finished after "
+              f"{deadline_at - started:g} s: {', '.join(pending)}")
     feed = []
-    for r in restaurants:
-        try:
-            menu = fetch_today_menu(r, today_name)
-        except Exception as e:
-            menu = f"Error fetching menu: {e}"
-        feed.append({
-            "name": r["name"],
-            "hours": r.get("hours", ""),
-            "prices": r.get("prices", {}),
-            "menu": menu
-        })
+    for r, m, menu in zip(catalog, per_restaurant, results):
+        if isinstance(menu, Exception):
+            menu = fallback_menu(r, day, menu, m)
+        feed.append(make_entry(r, menu, m))
+    if not preview:
+        weekly_snapshot.save()
+    parser_memo.save()
+    site_health.save()
+    if metrics is not None:
+        metrics.extend(per_restaurant)
     return feed
 
 
-def save_feed(feed):
-    date_str = datetime.today().strftime("%d.%m.%Y")
+def item_hash(item):
+    """Hash of a restaurant's entry: what decides whether the feed changed."""
+    payload = json.dumps({**item, "menu": item["menu"].to_dict()}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
 
-    # README.md
-    with open("README.md", "w", encoding="utf-8") as f:
-        f.write(f"# 🍽️ Lauttasaari Lunch Menus — {date_str}\n\n")
-        f.write(f"### {today_name}\n\n")
-        for item in feed:
-            f.write(f"## {item['name']}\n")
-            if item["hours"]:
-                f.write(f"**Opening hours:** {item['hours']}\n\n")
-            if item["prices"]:
-                f.write("**Prices:**\n")
-                for k, v in item["prices"].items():
-                    f.write(f"- {k}: {v}\n")
-                f.write("\n")
-            f.write(f"**{today_name} menu:**\n\n")  # newline before bullets
-            f.write(f"{item['menu']}\n\n")
-            f.write("---\n\n")
-
-    # feed.xml
-    with open("feed.xml", "w", encoding="utf-8") as f:
-        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
-        f.write("<lunchFeed>\n")
-        f.write(f"  <date>{html.escape(date_str)}</date>\n")
-        f.write(f"  <day>{html.escape(today_name)}</day>\n")
+
+def render_key(content_hash, item, meta):
+    """Hash of everything a restaurant's rendered block depends on.
+
+    Blocks also show the date and weekday, and a stale menu its age, so they
+    are rendered again when those change even though the entry did not.
+    """
+    age = item["menu"].age_seconds(meta["generated"])
+    payload = json.dumps([content_hash, meta["date"], meta["day"], age])
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def load_manifest():
+    try:
+        with open(MANIFEST_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"order": [], "restaurants": {}}
+
+
+def save_manifest(manifest):
+    write_json(MANIFEST_PATH, manifest)
+
+
+def feed_meta(day=None):
+    day = date.today() if day is None else day
+    return {
+        "date": day.strftime("%d.%m.%Y"),
+        "day": weekday_name(day),
+        "generated": datetime.now(timezone.utc),
+    }
+
+
+def block_path(fmt, key):
+    return os.path.join(BLOCK_DIR, fmt, key)
+
+
+def load_block(fmt, key):
+    """A stored rendered block, or None if it is not in the block store."""
+    try:
+        with open(block_path(fmt, key), encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def store_block(fmt, key, block):
+    os.makedirs(os.path.join(BLOCK_DIR, fmt), exist_ok=True)
+    with open(block_path(fmt, key), "w", encoding="utf-8") as f:
+        f.write(block)
+
+
+def prune_blocks(formats, keys):
+    """Delete stored blocks whose render key is no longer in the manifest."""
+    for fmt in formats:
+        try:
+            entries = list(os.scandir(os.path.join(BLOCK_DIR, fmt)))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.name not in keys:
+                os.remove(entry.path)
+
+
+def save_feed(feed, meta, writers=WRITERS):
+    """Stream the feed to every output in one pass; return whether any restaurant changed.
+
+    Each restaurant block is keyed in the manifest by its entry and what it
+    shows of the run (render_key), so blocks that would come out the same are
+    streamed from the block store instead of rendered again; only one block
+    is held in memory at a time. The outputs are left untouched when no
+    block and no date changed. A new date alone rewrites the headers and the
+    weekday-dependent blocks but does not count as a change, so the publish
+    step can still be skipped.
+    """
+    previous = load_manifest()
+    order = [item["name"] for item in feed]
+    hashes = {item["name"]: item_hash(item) for item in feed}
+    keys = {item["name"]: render_key(hashes[item["name"]], item, meta) for item in feed}
+    formats = [w.format for w in writers]
+    changed = [name for name in order if previous["restaurants"].get(name, {}).get("hash") != hashes[name]]
+    content_changed = bool(changed) or order != previous["order"]
+    stale = [name for name in order
+             if previous["restaurants"].get(name, {}).get("key") != keys[name]
+             or any(fmt not in previous["restaurants"][name].get("formats", ()) for fmt in formats)]
+    outputs_exist = all(os.path.exists(w.path) for w in writers)
+    same_header = previous.get("header") == [meta["date"], meta["day"]]
+    if not stale and same_header and not content_changed and outputs_exist:
+        print(f"[output] no restaurant changed; {', '.join(w.path for w in writers)} left as they are")
+        return False
+
+    files = [open(w.path + ".tmp", "w", encoding="utf-8") for w in writers]
+    try:
+        outputs = [w(f, meta) for w, f in zip(writers, files)]
+        for out in outputs:
+            out.begin()
+        rendered = set()
         for item in feed:
-            f.write("  <restaurant>\n")
-            f.write(f"    <name>{html.escape(item['name'])}</name>\n")
-            if item["hours"]:
-                f.write(f"    <hours>{html.escape(item['hours'])}</hours>\n")
-            for k, v in item["prices"].items():
-                f.write(f"    <price name='{html.escape(k)}'>{html.escape(v)}</price>\n")
-            f.write(f"    <menu><![CDATA[{item['menu']}]]></menu>\n")
-            f.write("  </restaurant>\n")
-        f.write("</lunchFeed>\n")
-
-
-def update_feed():
-    feed = build_feed()
-    save_feed(feed)
+            name = item["name"]
+            for out in outputs:
+                block = load_block(out.format, keys[name]) if name not in stale else None
+                if block is None:
+                    block = out.render_item(item)
+                    store_block(out.format, keys[name], block)
+                    rendered.add(name)
+                out.write_block(block)
+        for out in outputs:
+            out.end()
+    finally:
+        for f in files:
+            f.close()
+    for w in writers:
+        os.replace(w.path + ".tmp", w.path)
+
+    save_manifest({"order": order, "header": [meta["date"], meta["day"]],
+                   "restaurants": {name: {"hash": hashes[name], "key": keys[name], "formats": formats}
+                                   for name in order}})
+    prune_blocks(formats, set(keys.values()))
+    print(f"[output] re-rendered {len(rendered)} of {len(order)} restaurants; "
+          f"changed: {', '.join(changed) or ('order' if content_changed else 'none')}")
+    return content_changed
+
+
+def filtered_documents(feed, meta, writers=FILTERED_WRITERS):
+    """Path -> (text, format) of every filtered feed variant, all rendered from one tag index."""
+    index = tag_index(feed)
+    documents = {}
+    for name, tags in FILTERED_FEEDS.items():
+        subset = filtered_feed(feed, index, tags)
+        for writer in writers:
+            path = f"{FILTERED_DIR}/{name}/{writer.path}"
+            documents[path] = (render_document(writer, subset, meta), writer.format)
+    tags = {tag: [{"restaurant": name, "item": position} for name, position in entries]
+            for tag, entries in sorted(index.items())}
+    documents[f"{FILTERED_DIR}/tags.json"] = (
+        json.dumps({"date": meta["date"], "tags": tags}, ensure_ascii=False) + "\n", "json")
+    return documents
+
+
+def save_filtered_feeds(feed, meta):
+    """Write the filtered feed variants that differ from the files on disk; return their paths."""
+    changed = []
+    for path, (text, _) in filtered_documents(feed, meta).items():
+        try:
+            with open(path, encoding="utf-8") as f:
+                if f.read() == text:
+                    continue
+        except OSError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(path + ".tmp", path)
+        changed.append(path)
+    if changed:
+        print(f"[filtered] updated {', '.join(changed)}")
+    else:
+        print(f"[filtered] no filtered feed changed; files under {FILTERED_DIR}/ left as they are")
+    return changed
+
+
+def report_changed(changed):
+    """Expose the result to GitHub Actions so the publish step can be skipped."""
+    output = os.environ.get("GITHUB_OUTPUT")
+    if output:
+        with open(output, "a", encoding="utf-8") as f:
+            f.write(f"changed={'true' if changed else 'false'}\n")
+
+
+# -----------------------------------
+# METRICS
+# -----------------------------------
+
+def save_metrics(metrics):
+    """One JSON line per restaurant for this run."""
+    run = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    with open(METRICS_PATH, "w", encoding="utf-8") as f:
+        for m in metrics:
+            f.write(json.dumps({"run": run, **m}, ensure_ascii=False) + "\n")
+
+
+def print_slowest(metrics, limit=5):
+    print(f"Slowest restaurants (metrics in {METRICS_PATH}):")
+    for m in sorted(metrics, key=lambda m: m.get("total_ms", 0), reverse=True)[:limit]:
+        print(f"  {m['name']:<20} {m.get('total_ms', 0):>8.1f} ms  "
+              f"fetch {m.get('fetch_ms', 0):.1f} ms, queue {m.get('queue_ms', 0):.1f} ms, "
+              f"parse {m.get('parse_ms', 0):.1f} ms, {m.get('bytes', 0)} B in, "
+              f"peak {m.get('peak_kib', 0):.0f} KiB, {m.get('parser', '-')}, {m['outcome']}")
+
+
+# -----------------------------------
+# SAVED STAGES
+# -----------------------------------
+# The fetch, parse and render commands hand their results to the next stage
+# through these files, so each stage can be rerun on its own.
+
+def dump_entries(feed):
+    return [{**item, "menu": item["menu"].to_dict()} for item in feed]
+
+
+def load_entries(entries):
+    return [dict(entry, menu=MenuResult.from_dict(entry["menu"])) for entry in entries]
+
+
+def fetch_pages(catalog, metrics=None):
+    """Download every page concurrently, once per URL; returns restaurant name -> {url, html, fetched}.
+
+    Failed fetches are left out. If a `metrics` list is given, it is extended
+    with one dict per restaurant, in catalog order.
+    """
+    per_restaurant = [{"name": r["name"]} for r in catalog]
+
+    def fetch(group):
+        m = per_restaurant[group[0]]
+        started = time.perf_counter()
+        try:
+            html_text = fetch_page([catalog[i] for i in group], m)
+            m["outcome"] = "fetched"
+        except Exception as e:
+            html_text = None
+            m["outcome"] = "error"
+            m["error"] = str(e)
+        m["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        for i in group[1:]:
+            per_restaurant[i].update(outcome=m["outcome"], fetched_with=m["name"], total_ms=m["total_ms"])
+            if "error" in m:
+                per_restaurant[i]["error"] = m["error"]
+        return html_text
+
+    fetched = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    pages = {}
+    groups = fetch_groups(catalog)
+    size_http_session(catalog)
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_CONCURRENCY, len(groups)))) as pool:
+        for group, future in zip(groups, submit_by_host(pool, groups, catalog, fetch)):
+            html_text = future.result()
+            for i in group:
+                if html_text is not None:
+                    pages[catalog[i]["name"]] = {"url": catalog[i]["url"], "html": html_text,
+                                                 "fetched": fetched}
+    site_health.save()
+    if metrics is not None:
+        metrics.extend(per_restaurant)
+    return pages
+
+
+def save_pages(pages):
+    """Add fetched pages to PAGES_PATH, replacing older copies of the same restaurants."""
+    try:
+        with open(PAGES_PATH, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    saved.update(pages)
+    write_json(PAGES_PATH, saved)
+
+
+def load_pages(catalog):
+    """Saved HTML by restaurant name, for catalog entries whose URL has not changed since the fetch."""
+    try:
+        with open(PAGES_PATH, encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    return {r["name"]: saved[r["name"]]["html"] for r in catalog
+            if saved.get(r["name"], {}).get("url") == r["url"]}
+
+
+def save_state(feed, metrics, day):
+    write_json(FEED_STATE_PATH, {"date": day.isoformat(), "entries": dump_entries(feed), "metrics": metrics})
+
+
+def load_state():
+    """The feed saved by the last parse or run: (feed, metrics, day)."""
+    try:
+        with open(FEED_STATE_PATH, encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        raise ValueError(f"no saved feed in {FEED_STATE_PATH}, run the parse command first")
+    return load_entries(state["entries"]), state["metrics"], date.fromisoformat(state["date"])
+
+
+def print_parse_stats(metrics):
+    """Pages parsed this run, how many started from the parser memo, and the strategies that failed first."""
+    parsed = [m for m in metrics if "parse_ms" in m and not m.get("snapshot")]
+    wasted = {m["name"]: m["wasted_parses"] for m in parsed if m.get("wasted_parses")}
+    detail = f" ({', '.join(f'{name} {n}' for name, n in wasted.items())})" if wasted else ""
+    print(f"[parse] {len(parsed)} pages parsed, {sum(1 for m in parsed if m.get('memo'))} from a remembered "
+          f"strategy, {sum(wasted.values())} wasted parses{detail}")
+
+
+# -----------------------------------
+# SHARDS
+# -----------------------------------
+
+def shard_path(index, count):
+    return os.path.join(SHARD_DIR, f"feed.shard-{index}-of-{count}.json")
+
+
+SHARD_KEYS = {"shard", "count", "catalog_size", "date", "entries", "metrics"}
+
+
+def save_shard(index, count, catalog_size, positions, feed, metrics, day):
+    """Write one shard's entries, tagged with their catalog positions, for merge_shards."""
+    path = shard_path(index, count)
+    entries = [{**entry, "index": pos} for pos, entry in zip(positions, dump_entries(feed))]
+    write_json(path, {"shard": index, "count": count, "catalog_size": catalog_size, "date": day.isoformat(),
+                      "entries": entries, "metrics": metrics})
+    return path
+
+
+def load_shards(paths):
+    """Combine shard files into one feed in catalog order; raises ValueError if shards are missing.
+
+    Returns the feed, its metrics and the day the shards were scraped for.
+    """
+    shards = []
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                shards.append(json.load(f))
+        except (OSError, ValueError) as e:
+            raise ValueError(f"cannot read shard file {path}: {e}")
+        if not isinstance(shards[-1], dict) or not SHARD_KEYS <= shards[-1].keys():
+            raise ValueError(f"{path} is not a shard file written by --shard")
+    if not shards:
+        raise ValueError("no shard files to merge")
+    count, size = shards[0]["count"], shards[0]["catalog_size"]
+    if any(sh["count"] != count or sh["catalog_size"] != size for sh in shards):
+        raise ValueError("shard files come from different shard counts or catalogs")
+    days = {sh.get("date") for sh in shards}
+    if len(days) > 1:
+        raise ValueError(f"shard files are for different dates: {', '.join(sorted(map(str, days)))}")
+    missing = sorted(set(range(1, count + 1)) - {sh["shard"] for sh in shards})
+    if missing:
+        raise ValueError(f"missing shard(s) {', '.join(map(str, missing))} of {count}")
+
+    entries, metrics = {}, {}
+    for sh in shards:
+        for entry, m in zip(sh["entries"], sh["metrics"]):
+            entries[entry["index"]] = entry
+            metrics[entry["index"]] = m
+    if sorted(entries) != list(range(size)):
+        raise ValueError("shard entries do not cover the catalog")
+
+    feed = load_entries([{k: v for k, v in entries[i].items() if k != "index"} for i in range(size)])
+    day = days.pop()
+    return feed, [metrics[i] for i in range(size)], date.fromisoformat(day) if day else date.today()
+
+
+# -----------------------------------
+# RUN
+# -----------------------------------
+
+def print_feed(feed, day):
     for item in feed:
         print(f"--- {item['name']} ---")
         print(f"Opening hours: {item['hours']}")
         print("Prices:")
         for k, v in item["prices"].items():
             print(f"  {k}: {v}")
-        print(f"{today_name} menu:\n{item['menu']}\n")
+        print(f"{weekday_name(day)} menu:\n{item['menu'].to_markdown()}\n")
+
+
+def print_http_stats():
+    print(f"[http] {http_stats['requests']} requests over {http_stats['connections']} new connections, "
+          f"{http_stats['retries']} retries")
+
+
+def write_outputs(feed, day):
+    """Write the feed, its delta and the filtered variants; return whether any restaurant changed."""
+    meta = feed_meta(day)
+    # The delta and filtered feeds derive from the same entries, so whether any
+    # restaurant changed is decided by save_feed alone
+    changed = save_feed(feed, meta)
+    save_delta(feed, meta)
+    save_filtered_feeds(feed, meta)
+    report_changed(changed)
+    return changed
+
+
+def publish(feed, metrics, day):
+    """Write the outputs, metrics and archive for a built feed and print the run summary."""
+    from archive import archive_feed
+
+    save_state(feed, metrics, day)
+    write_outputs(feed, day)
+    save_metrics(metrics)
+    archived = archive_feed(feed, day, weekday_name(day))
+    print(f"[archive] stored {archived} menu items")
+    print_feed(feed, day)
+    print_slowest(metrics)
+    print_parse_stats(metrics)
+    print_http_stats()
+
+
+def update_feed(catalog=None, day=None):
+    day = date.today() if day is None else day
+    metrics = []
+    feed = build_feed(metrics, catalog, day)
+    publish(feed, metrics, day)
+
+
+def preview_feed(catalog, day, pages=None):
+    """Build and print the feed for some restaurants without writing any output."""
+    metrics = []
+    feed = build_feed(metrics, catalog, day, pages, preview=True)
+    print_feed(feed, day)
+    print_slowest(metrics)
+    print_parse_stats(metrics)
+    print(f"[cli] {len(feed)} selected restaurant(s): outputs not written")
+
+
+def update_shard(catalog, index, count, day):
+    """Scrape one shard of the catalog and save it for a later merge."""
+    pairs = shard(catalog, index, count)
+    positions = [pos for pos, _ in pairs]
+    metrics = []
+    feed = build_feed(metrics, [entry for _, entry in pairs], day)
+    path = save_shard(index, count, len(catalog), positions, feed, metrics, day)
+    print(f"[shard] {index}/{count}: {len(feed)} of {len(catalog)} restaurants saved to {path}")
+
+
+def merge_shards(paths, feed, metrics, day):
+    """Publish the feed combined by load_shards from `paths`."""
+    print(f"[shard] merged {len(paths)} shard files, {len(feed)} restaurants")
+    publish(feed, metrics, day)
+
+
+def fetch_command(catalog):
+    metrics = []
+    pages = fetch_pages(catalog, metrics)
+    save_pages(pages)
+    for m in metrics:
+        detail = m.get("error") or (f"same page as {m['fetched_with']}" if "fetched_with" in m else
+                                    f"{m.get('bytes', 0)} B in, peak {m.get('peak_kib', 0):.0f} KiB, "
+                                    f"{m.get('stopped') or m.get('cache')}")
+        print(f"  {m['name']:<20} {m['total_ms']:>8.1f} ms  {detail}")
+    print(f"[fetch] saved {len(pages)} of {len(catalog)} pages to {PAGES_PATH}")
+    print_http_stats()
+
+
+def parse_command(catalog, day, partial):
+    """Parse the pages saved by fetch; the full catalog is saved for render."""
+    if partial:
+        preview_feed(catalog, day, load_pages(catalog))
+        return
+    metrics = []
+    feed = build_feed(metrics, catalog, day, load_pages(catalog))
+    save_state(feed, metrics, day)
+    print_feed(feed, day)
+    print_slowest(metrics)
+    print_parse_stats(metrics)
+    print(f"[parse] saved {len(feed)} restaurants for {day.isoformat()} to {FEED_STATE_PATH}")
+
+
+def render_command(feed, day):
+    """Write the outputs from the feed saved by the last parse or run, without fetching or parsing.
+
+    main loads that feed with load_state.
+    """
+    write_outputs(feed, day)
+
+
+def select_restaurants(catalog, names):
+    """Catalog entries whose name contains any of `names`, ignoring case."""
+    wanted = [n.lower() for n in names]
+    selected = [r for r in catalog if any(w in r["name"].lower() for w in wanted)]
+    if not selected:
+        raise ValueError(f"no restaurant matches {', '.join(names)}; "
+                         f"the catalog has {', '.join(r['name'] for r in catalog)}")
+    return selected
+
+
+def parse_shard_spec(spec):
+    try:
+        index, count = (int(x) for x in spec.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected i/n, got {spec!r}")
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {spec} out of range")
+    return index, count
+
+
+def parse_date(text):
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected YYYY-MM-DD, got {text!r}")
+
+
+COMMANDS = {
+    "run": "fetch, parse and publish every output (default)",
+    "fetch": f"download the pages into {PAGES_PATH}",
+    "parse": f"parse the fetched pages into {FEED_STATE_PATH}",
+    "render": "write the outputs from the last parsed feed",
+}
+
+
+def parse_latency(text):
+    if text == "recorded":
+        return text
+    try:
+        ms = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected milliseconds or 'recorded', got {text!r}")
+    if ms < 0:
+        raise argparse.ArgumentTypeError("latency cannot be negative")
+    return ms
+
+
+def parse_rate(text):
+    try:
+        rate = float(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected a number between 0 and 1, got {text!r}")
+    if not 0 <= rate <= 1:
+        raise argparse.ArgumentTypeError("rate must be between 0 and 1")
+    return rate
+
+
+def setup_fetch_layer(args):
+    """Install the recorder or replay asked for on the command line."""
+    global fetch_recorder, fetch_replay
+    from recording import FetchRecorder, FetchReplay
+
+    if args.record:
+        fetch_recorder = FetchRecorder(args.record)
+    if args.replay:
+        fetch_replay = FetchReplay(args.replay, args.replay_latency, args.replay_errors, args.replay_seed)
+        print(f"[replay] serving {len(fetch_replay)} recorded responses from {args.replay}")
+
+
+def finish_fetch_layer():
+    if fetch_recorder is not None:
+        count, size = fetch_recorder.save()
+        print(f"[record] {count} responses saved to {fetch_recorder.path} ({size / 1024:.1f} KiB)")
+    if fetch_replay is not None:
+        print("[replay] {served} served, {injected} injected errors, "
+              "{missing} not recorded".format(**fetch_replay.stats))
+
+
+def enter_state_dir(args):
+    """Change to the directory the outputs and state are written in.
+
+    Every output and state path is relative, so a run in another directory
+    leaves the published feed, archive, delta sequence and circuit breakers
+    here untouched. A replay gets a scratch directory of its own unless one
+    is given: its recorded pages and injected failures must not reach them.
+    File arguments are resolved first, against the directory the run started in.
+    """
+    state_dir = args.state_dir
+    if state_dir is None and args.replay:
+        state_dir = tempfile.mkdtemp(prefix="lounas-replay-")
+    if state_dir is None:
+        return
+    for name in ("catalog", "record", "replay"):
+        if getattr(args, name):
+            setattr(args, name, os.path.abspath(getattr(args, name)))
+    if args.merge:
+        args.merge = [os.path.abspath(path) for path in args.merge]
+    state_dir = os.path.abspath(state_dir)
+    os.makedirs(state_dir, exist_ok=True)
+    os.chdir(state_dir)
+    print(f"[state] outputs and state under {state_dir}")
+
+
+def exit_if_abandoned():
+    """Exit right away, once the outputs are written, if build_feed abandoned work.
+
+    Shutting the pools down without waiting only lets build_feed return: the
+    interpreter still joins the fetch threads and parse processes on exit,
+    which would hold the run up until their requests time out.
+    """
+    if not abandoned_work:
+        return
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Scrape lunch menus and publish the feed.",
+        epilog="commands: " + "; ".join(f"{name}: {help}" for name, help in COMMANDS.items()))
+    parser.add_argument("command", nargs="?", default="run", choices=COMMANDS)
+    parser.add_argument("--catalog", help="restaurant catalog JSON (default: restaurants.json)")
+    parser.add_argument("--restaurant", action="append", metavar="NAME",
+                        help="only restaurants whose name contains NAME; prints instead of publishing")
+    parser.add_argument("--date", type=parse_date, default=None, metavar="YYYY-MM-DD",
+                        help="day to extract menus for (default: today)")
+    parser.add_argument("--shard", type=parse_shard_spec, metavar="I/N",
+                        help="scrape only shard I of N (1-based) and save it under shards/")
+    parser.add_argument("--merge", nargs="*", metavar="FILE",
+                        help="merge shard files (default: shards/*.json) into the outputs")
+    parser.add_argument("--record", metavar="ARCHIVE",
+                        help="save every fetched response to a zip archive for --replay")
+    parser.add_argument("--replay", metavar="ARCHIVE",
+                        help="serve fetches from a --record archive instead of the network")
+    parser.add_argument("--replay-latency", type=parse_latency, metavar="MS",
+                        help="delay each replayed response by MS milliseconds, or 'recorded'")
+    parser.add_argument("--replay-errors", type=parse_rate, default=0.0, metavar="RATE",
+                        help="share of replayed requests answered with an injected 503, "
+                             "retried like real fetches")
+    parser.add_argument("--replay-seed", type=int, default=0, help="seed choosing the injected errors")
+    parser.add_argument("--state-dir", metavar="DIR",
+                        help="read and write the outputs and .cache state under DIR "
+                             "(default: the current directory; with --replay, a new scratch directory)")
+    args = parser.parse_args()
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be combined")
+    if not args.replay and (args.replay_latency is not None or args.replay_errors):
+        parser.error("--replay-latency and --replay-errors need --replay")
+    if (args.record or args.replay) and (args.command in ("parse", "render") or args.merge is not None):
+        parser.error("--record and --replay apply to commands that fetch: run and fetch")
+    if args.command != "run" and (args.shard or args.merge is not None):
+        parser.error("--shard and --merge only apply to the run command")
+    if args.command == "render" and (args.restaurant or args.date):
+        parser.error("render writes the saved feed as it is; select restaurants and date when parsing")
+
+    enter_state_dir(args)
+    if args.command == "render":
+        try:
+            feed, _, day = load_state()
+        except ValueError as e:
+            parser.error(str(e))
+        render_command(feed, day)
+        return
+    if args.merge is not None:
+        paths = args.merge or sorted(glob.glob(os.path.join(SHARD_DIR, "*.json")))
+        try:
+            merged = load_shards(paths)
+        except ValueError as e:
+            parser.error(str(e))
+        merge_shards(paths, *merged)
+        return
+    day = args.date or date.today()
+    try:
+        catalog = load_restaurants(args.catalog) if args.catalog else default_catalog()
+        PARSER_CHAINS.update(resolve_parser_chains(catalog))
+    except (OSError, ValueError) as e:
+        parser.error(str(e))
+    if args.restaurant:
+        try:
+            catalog = select_restaurants(catalog, args.restaurant)
+        except ValueError as e:
+            parser.error(str(e))
+
+    if args.record or args.replay:
+        setup_fetch_layer(args)
+    if args.command == "fetch":
+        fetch_command(catalog)
+    elif args.command == "parse":
+        parse_command(catalog, day, bool(args.restaurant))
+    elif args.shard:
+        update_shard(catalog, *args.shard, day)
+    elif args.restaurant:
+        preview_feed(catalog, day)
+    else:
+        update_feed(catalog, day)
+    finish_fetch_layer()
+    exit_if_abandoned()
 
 
 if __name__ == "__main__":
-    update_feed()
\ No newline at end of file
+    main()
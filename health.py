@@ -0,0 +1,104 @@
+# health.py
+import json
+import os
+import threading
+import time
+
+
+class SiteHealth:
+    """Persistent per-restaurant fetch history driving a circuit breaker.
+
+    For every restaurant it keeps exponentially weighted averages of the
+    success rate and fetch latency, and the number of consecutive failures.
+    After `threshold` failures in a row the circuit opens and the site is
+    skipped for `cooldown` seconds, doubling with every further failure up to
+    `max_cooldown`. The first fetch after the cool-down is a trial: success
+    closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, path, smoothing=0.3, threshold=3, cooldown=20 * 3600, max_cooldown=7 * 24 * 3600):
+        self.path = path
+        self.smoothing = smoothing
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._lock = threading.Lock()
+        self._sites = None
+
+    # -----------------------------------
+    # STATE FILE
+    # -----------------------------------
+
+    def _load(self):
+        if self._sites is None:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._sites = json.load(f)
+            except (OSError, ValueError):
+                self._sites = {}
+        return self._sites
+
+    def save(self):
+        with self._lock:
+            if self._sites is None:
+                return
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self._sites, f, ensure_ascii=False, indent=1)
+            os.replace(tmp, self.path)
+
+    # -----------------------------------
+    # PUBLIC API
+    # -----------------------------------
+
+    def get(self, name):
+        """Copy of the stored state for a restaurant, or None if it was never fetched."""
+        with self._lock:
+            site = self._load().get(name)
+            return dict(site) if site else None
+
+    def open_until(self, name, now=None):
+        """Epoch time the circuit stays open until, or None when the site may be fetched."""
+        now = time.time() if now is None else now
+        with self._lock:
+            until = self._load().get(name, {}).get("open_until")
+        return until if until and until > now else None
+
+    def record(self, name, ok, latency_ms, error=None, now=None):
+        """Fold one fetch into the averages and open or close the circuit."""
+        now = time.time() if now is None else now
+        a = self.smoothing
+        with self._lock:
+            site = self._load().setdefault(name, {
+                "attempts": 0, "failures": 0, "success_rate": 1.0, "latency_ms": latency_ms,
+                "consecutive_failures": 0, "open_until": None, "last_error": None, "last_success": None,
+            })
+            site["attempts"] += 1
+            site["success_rate"] = round((1 - a) * site["success_rate"] + a * (1.0 if ok else 0.0), 4)
+            site["latency_ms"] = round((1 - a) * site["latency_ms"] + a * latency_ms, 1)
+            if ok:
+                site["consecutive_failures"] = 0
+                site["open_until"] = None
+                site["last_success"] = now
+                return
+            site["failures"] += 1
+            site["consecutive_failures"] += 1
+            site["last_error"] = error
+            extra = site["consecutive_failures"] - self.threshold
+            if extra >= 0:
+                site["open_until"] = now + min(self.cooldown * 2 ** extra, self.max_cooldown)
+
+    def expected_ms(self, name, retries=0):
+        """Expected fetch time, counting the retries an unreliable site tends to need; None if unknown."""
+        site = self.get(name)
+        if site is None:
+            return None
+        return site["latency_ms"] * (1 + (1 - site["success_rate"]) * retries)
+
+    def schedule(self, names, retries=0):
+        """Positions of `names` in fetch order: never-seen sites, then the slowest expected first."""
+        expected = [self.expected_ms(name, retries) for name in names]
+        return sorted(range(len(names)),
+                      key=lambda i: -expected[i] if expected[i] is not None else float("-inf"))
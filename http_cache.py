@@ -0,0 +1,123 @@
+# http_cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class HttpCache:
+    """Persistent response cache keyed by URL, revalidated with ETag/Last-Modified.
+
+    Bodies live in one file per URL next to an `index.json` holding the
+    validators and last use time. When the bodies exceed `max_bytes` the
+    least recently used entries are evicted.
+    """
+
+    def __init__(self, directory, max_bytes=20 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._index = None
+
+    # -----------------------------------
+    # INDEX
+    # -----------------------------------
+
+    def _index_path(self):
+        return os.path.join(self.directory, "index.json")
+
+    def _body_path(self, key):
+        return os.path.join(self.directory, f"{key}.html")
+
+    def _load_index(self):
+        if self._index is None:
+            try:
+                with open(self._index_path(), encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _save_index(self):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp = self._index_path() + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._index, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self._index_path())
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+    # -----------------------------------
+    # PUBLIC API
+    # -----------------------------------
+
+    def conditional_headers(self, url):
+        """Request headers that let the server answer 304 for a cached URL."""
+        with self._lock:
+            entry = self._load_index().get(self.key(url))
+        if not entry:
+            return {}
+        headers = {}
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def load(self, url):
+        """Return the cached body for `url` and mark it as recently used, or None."""
+        key = self.key(url)
+        with self._lock:
+            entry = self._load_index().get(key)
+            if not entry:
+                return None
+            try:
+                with open(self._body_path(key), encoding="utf-8") as f:
+                    body = f.read()
+            except OSError:
+                del self._index[key]
+                self._save_index()
+                return None
+            entry["used"] = time.time()
+            self._save_index()
+        return body
+
+    def store(self, url, body, headers):
+        """Save a 200 response if it carries a validator, then enforce the size bound."""
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        if not etag and not last_modified:
+            return
+        key = self.key(url)
+        data = body.encode("utf-8")
+        with self._lock:
+            index = self._load_index()
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self._body_path(key), "wb") as f:
+                f.write(data)
+            index[key] = {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "size": len(data),
+                "used": time.time(),
+            }
+            self._evict(keep=key)
+            self._save_index()
+
+    def _evict(self, keep=None):
+        total = sum(e["size"] for e in self._index.values())
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1]["used"]):
+            if total <= self.max_bytes:
+                break
+            if key == keep:
+                continue
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+            total -= entry["size"]
+            del self._index[key]
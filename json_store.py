@@ -0,0 +1,43 @@
+# json_store.py
+import json
+import os
+import threading
+
+
+def write_json(path, data):
+    """Write `data` as JSON through a temporary file, so readers never see half a file."""
+    if os.path.dirname(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+class JsonStore:
+    """A JSON object kept in a state file, read on first use and written back by save.
+
+    `load` returns the same dict every time, so callers change it in place,
+    holding `lock` while they do; a missing or unreadable file starts empty.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self._data = None
+
+    def load(self):
+        with self.lock:
+            if self._data is None:
+                try:
+                    with open(self.path, encoding="utf-8") as f:
+                        self._data = json.load(f)
+                except (OSError, ValueError):
+                    self._data = {}
+            return self._data
+
+    def save(self):
+        """Write the object back; nothing happens if it was never loaded."""
+        with self.lock:
+            if self._data is not None:
+                write_json(self.path, self._data)
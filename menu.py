@@ -0,0 +1,99 @@
+# menu.py
+from dataclasses import dataclass, replace
+from datetime import datetime
+from enum import Enum
+
+from dietary import dietary_tags
+
+
+class MenuStatus(str, Enum):
+    OK = "ok"
+    NOT_FOUND = "not_found"
+    ERROR = "error"
+
+
+@dataclass(frozen=True, slots=True)
+class MenuResult:
+    """What a parser found for one restaurant and day.
+
+    `items` holds the menu lines as plain text; Markdown bullets and status
+    messages are only produced by the renderers. `tags` holds the normalized
+    diet markers of each item, in the same order. A stale menu was not fetched
+    this run but reused from an earlier parse made at `as_of` (ISO 8601, UTC).
+    """
+    status: MenuStatus
+    items: tuple = ()
+    parser: str = None
+    error: str = None
+    stale: bool = False
+    as_of: str = None
+    tags: tuple = ()
+
+    @classmethod
+    def found(cls, items, parser=None):
+        items = tuple(line.strip() for line in items if line and line.strip())
+        if not items:
+            return cls(MenuStatus.NOT_FOUND, parser=parser)
+        return cls(MenuStatus.OK, items, parser, tags=tuple(tuple(dietary_tags(line)) for line in items))
+
+    @classmethod
+    def failed(cls, error, parser=None):
+        return cls(MenuStatus.ERROR, parser=parser, error=str(error))
+
+    @property
+    def ok(self):
+        return self.status is MenuStatus.OK
+
+    def with_parser(self, parser):
+        return replace(self, parser=parser)
+
+    def as_stale(self, as_of):
+        return replace(self, stale=True, as_of=as_of)
+
+    def only(self, positions):
+        """The same menu narrowed to the items at `positions`."""
+        return replace(self, items=tuple(self.items[i] for i in positions),
+                       tags=tuple(self.tags[i] for i in positions))
+
+    def age_seconds(self, now):
+        """Seconds between the parse a stale menu comes from and `now`, or None if unknown."""
+        if not self.stale or not self.as_of:
+            return None
+        return max(0, int((now - datetime.fromisoformat(self.as_of)).total_seconds()))
+
+    def message(self):
+        """Human-readable text for a menu without items."""
+        if self.status is MenuStatus.ERROR:
+            return f"Error fetching menu: {self.error}"
+        return "Menu not found"
+
+    def lines(self):
+        return list(self.items) if self.ok else [self.message()]
+
+    def to_markdown(self):
+        """Markdown bullets with hard line breaks, as published in README.md and feed.xml."""
+        if not self.ok:
+            return self.message()
+        return "".join(f"• {line}  \n" for line in self.items)
+
+    def to_dict(self):
+        data = {"status": self.status.value, "items": list(self.items), "parser": self.parser}
+        if self.items:
+            data["tags"] = [list(tags) for tags in self.tags]
+        if self.error is not None:
+            data["error"] = self.error
+        if self.stale:
+            data["stale"] = True
+            data["as_of"] = self.as_of
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        items = tuple(data.get("items", ()))
+        # Menus saved before tags were stored get them from the text
+        tags = data.get("tags") or [dietary_tags(line) for line in items]
+        return cls(MenuStatus(data["status"]), items, data.get("parser"), data.get("error"),
+                   data.get("stale", False), data.get("as_of"), tuple(tuple(t) for t in tags))
+
+
+MENU_NOT_FOUND = MenuResult(MenuStatus.NOT_FOUND)
@@ -0,0 +1,175 @@
+# recording.py
+import hashlib
+import json
+import os
+import threading
+import time
+import zipfile
+from email.message import Message
+from urllib.parse import urldefrag
+
+# Wire-level headers that no longer describe a body stored decoded
+DROPPED_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection", "keep-alive"}
+
+
+class ReplayHTTPError(Exception):
+    """Error status of a replayed response, worded like requests' HTTPError."""
+
+
+class RecordedResponse:
+    """Stand-in for a streamed requests.Response whose body is already in memory.
+
+    Offers what fetch_html and read_page use: status_code, ok, reason,
+    headers (case-insensitive), iter_content, raw.tell, close and
+    raise_for_status.
+    """
+
+    def __init__(self, url, status_code, headers, body, reason=""):
+        self.url = url
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = Message()
+        for name, value in headers.items():
+            self.headers[name] = value
+        self.body = body
+        self.raw = self
+        self._read = 0
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            chunk = self.body[start:start + chunk_size]
+            self._read = start + len(chunk)
+            yield chunk
+
+    def tell(self):
+        return self._read
+
+    def close(self):
+        pass
+
+    def raise_for_status(self):
+        if not self.ok:
+            kind = "Client" if self.status_code < 500 else "Server"
+            raise ReplayHTTPError(f"{self.status_code} {kind} Error: {self.reason} for url: {self.url}")
+
+
+# -----------------------------------
+# RECORDING
+# -----------------------------------
+
+class FetchRecorder:
+    """Keeps every response of a run for FetchReplay and saves them as one zip archive.
+
+    The archive holds `responses.json` (URL -> status, reason, headers, fetch
+    time and body digest) and one deflated member per distinct body, so pages
+    shared by several URLs are stored once. Bodies are kept decoded; the
+    latest response per URL wins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._responses = {}
+        self._bodies = {}
+
+    def record(self, url, get):
+        """Call `get()` for a streamed response, read it whole and keep it; return a RecordedResponse."""
+        started = time.perf_counter()
+        resp = get()
+        try:
+            body = resp.content
+        finally:
+            resp.close()
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        headers = {k: v for k, v in resp.headers.items() if k.lower() not in DROPPED_HEADERS}
+        digest = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._bodies[digest] = body
+            self._responses[url] = {
+                "status": resp.status_code, "reason": resp.reason, "headers": headers,
+                "elapsed_ms": elapsed_ms, "body": digest,
+            }
+        return RecordedResponse(url, resp.status_code, headers, body, resp.reason)
+
+    def save(self):
+        """Write the archive; return (responses, archive bytes)."""
+        with self._lock:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+                zf.writestr("responses.json", json.dumps(self._responses, ensure_ascii=False, sort_keys=True))
+                for digest, body in self._bodies.items():
+                    zf.writestr(f"bodies/{digest}", body)
+            os.replace(tmp, self.path)
+            return len(self._responses), os.path.getsize(self.path)
+
+
+# -----------------------------------
+# REPLAY
+# -----------------------------------
+
+class FetchReplay:
+    """Serves a FetchRecorder archive in place of the network.
+
+    `latency` delays every response: a number of milliseconds, or "recorded"
+    for the time the original fetch took. A share `error_rate` of the
+    requests gets an injected 503 instead of the recording; which ones
+    depends only on `seed`, the URL and how often it was requested, so a
+    replay fails the same way whatever order the threads run in. A URL with
+    a fragment not in the archive is served the recording without it, which
+    lets a catalog list one page many times; unknown URLs get a 404.
+    """
+
+    def __init__(self, path, latency=None, error_rate=0.0, seed=0):
+        self.path = path
+        self.latency = latency
+        self.error_rate = error_rate
+        self.seed = seed
+        self._zip = zipfile.ZipFile(path)
+        self._responses = json.loads(self._zip.read("responses.json"))
+        self._lock = threading.Lock()
+        self._bodies = {}
+        self._attempts = {}
+        self.stats = {"served": 0, "injected": 0, "missing": 0}
+
+    def __len__(self):
+        return len(self._responses)
+
+    def _body(self, digest):
+        with self._lock:
+            body = self._bodies.get(digest)
+            if body is None:
+                body = self._bodies[digest] = self._zip.read(f"bodies/{digest}")
+            return body
+
+    def _injected(self, url):
+        with self._lock:
+            attempt = self._attempts[url] = self._attempts.get(url, 0) + 1
+        digest = hashlib.sha1(f"{self.seed}|{url}|{attempt}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big") / 2 ** 64 < self.error_rate
+
+    def get(self, url):
+        """The recorded response for `url`, after the simulated latency."""
+        entry = self._responses.get(url) or self._responses.get(urldefrag(url).url)
+        if self.latency == "recorded":
+            delay_ms = entry["elapsed_ms"] if entry else 0
+        else:
+            delay_ms = self.latency or 0
+        if delay_ms:
+            time.sleep(delay_ms / 1000)
+        if entry is None:
+            outcome, resp = "missing", RecordedResponse(url, 404, {}, b"", "Not Recorded")
+        elif self.error_rate and self._injected(url):
+            outcome, resp = "injected", RecordedResponse(url, 503, {}, b"", "Injected Failure")
+        else:
+            outcome = "served"
+            body = self._body(entry["body"])
+            resp = RecordedResponse(url, entry["status"], entry["headers"], body, entry["reason"])
+        with self._lock:
+            self.stats[outcome] += 1
+        return resp
@@ -0,0 +1,196 @@
+# renderers.py
+import html
+import io
+import json
+from email.utils import format_datetime
+
+FEED_TITLE = "Lauttasaari Lunch Feed"
+FEED_LINK = "https://bubbe404.github.io/lounas-feed/"
+
+
+def escape(text):
+    # Same as xml.sax.saxutils.escape, which would pull in urllib on import
+    return html.escape(text, quote=False)
+
+
+def stale_note(menu, meta):
+    """Reader-facing note for a menu reused from an earlier parse, or None."""
+    if not menu.stale:
+        return None
+    age = menu.age_seconds(meta["generated"])
+    if age is None:
+        return "Menu from an earlier check; the site did not answer this time."
+    if age < 3600:
+        return f"Menu from an earlier check {max(1, age // 60)} min ago; the site did not answer this time."
+    return f"Menu from an earlier check {age // 3600} h ago; the site did not answer this time."
+
+
+# -----------------------------------
+# WRITERS
+# -----------------------------------
+# Each writer streams one output file: begin() writes the header, write_block()
+# appends one restaurant rendered by render_item(), end() closes the document.
+# render_item() only depends on the item and the feed metadata, so blocks can be
+# cached by content hash and replayed without rendering again.
+
+class FeedWriter:
+    format = None
+    path = None
+
+    def __init__(self, f, meta):
+        self.f = f
+        self.meta = meta
+
+    def begin(self):
+        pass
+
+    def render_item(self, item):
+        raise NotImplementedError
+
+    def write_block(self, block):
+        self.f.write(block)
+
+    def end(self):
+        pass
+
+
+class MarkdownWriter(FeedWriter):
+    format = "markdown"
+    path = "README.md"
+
+    def begin(self):
+        self.f.write(f"# 🍽️ Lauttasaari Lunch Menus — {self.meta['date']}\n\n")
+        self.f.write(f"### {self.meta['day']}\n\n")
+
+    def render_item(self, item):
+        lines = [f"## {item['name']}\n"]
+        if item["hours"]:
+            lines.append(f"**Opening hours:** {item['hours']}\n\n")
+        if item["prices"]:
+            lines.append("**Prices:**\n")
+            for k, v in item["prices"].items():
+                lines.append(f"- {k}: {v}\n")
+            lines.append("\n")
+        lines.append(f"**{self.meta['day']} menu:**\n\n")  # newline before bullets
+        lines.append(f"{item['menu'].to_markdown()}\n\n")
+        note = stale_note(item["menu"], self.meta)
+        if note:
+            lines.append(f"_{note}_\n\n")
+        lines.append("---\n\n")
+        return "".join(lines)
+
+
+class XmlWriter(FeedWriter):
+    """The original <lunchFeed> document."""
+    format = "xml"
+    path = "feed.xml"
+
+    def begin(self):
+        self.f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.f.write("<lunchFeed>\n")
+        self.f.write(f"  <date>{html.escape(self.meta['date'])}</date>\n")
+        self.f.write(f"  <day>{html.escape(self.meta['day'])}</day>\n")
+
+    def render_item(self, item):
+        lines = ["  <restaurant>\n", f"    <name>{html.escape(item['name'])}</name>\n"]
+        if item["hours"]:
+            lines.append(f"    <hours>{html.escape(item['hours'])}</hours>\n")
+        for k, v in item["prices"].items():
+            lines.append(f"    <price name='{html.escape(k)}'>{html.escape(v)}</price>\n")
+        menu = item["menu"]
+        attrs = ""
+        if menu.stale:
+            age = menu.age_seconds(self.meta["generated"])
+            attrs = ' stale="true"'
+            if age is not None:
+                attrs += f' asOf="{html.escape(menu.as_of)}" ageSeconds="{age}"'
+        lines.append(f"    <menu{attrs}><![CDATA[{menu.to_markdown()}]]></menu>\n")
+        lines.append("  </restaurant>\n")
+        return "".join(lines)
+
+    def end(self):
+        self.f.write("</lunchFeed>\n")
+
+
+class RssWriter(FeedWriter):
+    """RSS 2.0 channel with one item per restaurant, as read by update_readme.py."""
+    format = "rss"
+    path = "lounas_feed.xml"
+
+    def begin(self):
+        self.f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        self.f.write('<rss version="2.0">\n')
+        self.f.write("  <channel>\n")
+        self.f.write(f"    <title>{escape(FEED_TITLE)}</title>\n")
+        self.f.write(f"    <link>{escape(FEED_LINK)}</link>\n")
+        self.f.write(f"    <description>{escape(self.meta['day'])} {escape(self.meta['date'])}</description>\n")
+        self.f.write("    <language>fi</language>\n")
+        self.f.write(f"    <lastBuildDate>{format_datetime(self.meta['generated'])}</lastBuildDate>\n")
+
+    def render_item(self, item):
+        description = ""
+        if item["hours"]:
+            description += f"<b>Opening hours:</b> {html.escape(item['hours'])}<br>"
+        description += "<br>".join(html.escape(line) for line in item["menu"].lines())
+        note = stale_note(item["menu"], self.meta)
+        if note:
+            description += f"<br><i>{html.escape(note)}</i>"
+        guid = f"{FEED_LINK}#{self.meta['date']}-{item['name']}"
+        return (
+            "    <item>\n"
+            f"      <title>{escape(item['name'])}</title>\n"
+            f"      <link>{escape(FEED_LINK)}</link>\n"
+            f"      <description>{escape(description)}</description>\n"
+            f'      <guid isPermaLink="false">{escape(guid)}</guid>\n'
+            f"      <pubDate>{format_datetime(self.meta['generated'])}</pubDate>\n"
+            "    </item>\n"
+        )
+
+    def end(self):
+        self.f.write("  </channel>\n")
+        self.f.write("</rss>\n")
+
+
+class JsonWriter(FeedWriter):
+    format = "json"
+    path = "feed.json"
+
+    def begin(self):
+        self.first = True
+        self.f.write("{\n")
+        self.f.write(f'  "date": {json.dumps(self.meta["date"])},\n')
+        self.f.write(f'  "day": {json.dumps(self.meta["day"])},\n')
+        self.f.write('  "restaurants": [')
+
+    def render_item(self, item):
+        menu = item["menu"].to_dict()
+        if item["menu"].stale:
+            menu["age_seconds"] = item["menu"].age_seconds(self.meta["generated"])
+        return json.dumps({
+            "name": item["name"],
+            "hours": item["hours"],
+            "prices": item["prices"],
+            "menu": menu,
+        }, ensure_ascii=False)
+
+    def write_block(self, block):
+        self.f.write("\n    " if self.first else ",\n    ")
+        self.f.write(block)
+        self.first = False
+
+    def end(self):
+        self.f.write("\n  ]\n}\n")
+
+
+WRITERS = [XmlWriter, RssWriter, JsonWriter, MarkdownWriter]
+
+
+def render_document(writer, feed, meta):
+    """A whole output document as a string, without the block cache used by save_feed."""
+    buf = io.StringIO()
+    out = writer(buf, meta)
+    out.begin()
+    for item in feed:
+        out.write_block(out.render_item(item))
+    out.end()
+    return buf.getvalue()
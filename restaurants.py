@@ -1,39 +1,95 @@
 # restaurants.py
+import functools
+import json
+import os
+import re
+from urllib.parse import urlsplit
 
-restaurants = [
-    {
-        "name": "Makiata",
-        "url": "https://www.makiata.fi/lounas/",
-        "hours": "11:00–13:00",
-        "prices": {"Buffet": "13,70€","Soup": "12,70€"},
-        "type": "table"
-    },
-    {
-        "name": "Bistro Telakka",
-        "url": "https://www.bistrotelakka.fi",
-        "hours": "11:00–14:00",
-        "prices": {"Buffet": "13,70€"},
-        "type": "list"
-    },
-    {
-        "name": "Persilja",
-        "url": "https://www.ravintolapersilja.fi/lounas",
-        "hours": "10:30–15:00",
-        "prices": {"Buffet": "13,70€"},
-        "type": "div_snippet"
-    },
-    {
-        "name": "Pisara",
-        "url": "https://ravintolapisara.fi/lounaslistat/lauttasaari",
-        "hours": "10:30-14:00",
-        "prices": {"Buffet": "13,00€", "House lunch": "12,00€", "Soup": "11,50€"},
-        "type": "simple_p"
-    },
-    {
-        "name": "Casa Mare",
-        "url": "https://www.ravintolacasamare.com/lounas/",
-        "hours": "11:00–14:00",
-        "prices": {"Buffet": "13,70€"},
-        "type": "div_snippet"
-    }
-]
+CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "restaurants.json")
+
+# Catalog keys and the type each must have; "name", "url" and "parser" are required
+FIELDS = {
+    "name": str,
+    "url": str,
+    "parser": str,
+    "hours": str,
+    "prices": dict,
+    "fallbacks": list,
+    "options": dict,
+    "backend": str,
+    "stop_at": str,
+    "max_bytes": int,
+}
+REQUIRED = ("name", "url", "parser")
+
+
+def validate_catalog(catalog):
+    """Return a list of problems with the catalog; empty when it is valid."""
+    if not isinstance(catalog, list):
+        return ["catalog must be a JSON list of restaurants"]
+    problems = []
+    names = set()
+    for i, entry in enumerate(catalog):
+        where = f"entry {i}"
+        if not isinstance(entry, dict):
+            problems.append(f"{where}: must be an object")
+            continue
+        where = f"entry {i} ({entry.get('name', '?')})"
+        for key in REQUIRED:
+            if not entry.get(key):
+                problems.append(f"{where}: missing {key!r}")
+        for key, value in entry.items():
+            if key not in FIELDS:
+                problems.append(f"{where}: unknown key {key!r}")
+            elif not isinstance(value, FIELDS[key]):
+                problems.append(f"{where}: {key!r} must be {FIELDS[key].__name__}")
+        if isinstance(entry.get("url"), str) and urlsplit(entry["url"]).scheme not in ("http", "https"):
+            problems.append(f"{where}: url must be http(s)")
+        if not all(isinstance(v, str) for v in (entry.get("prices") or {}).values()):
+            problems.append(f"{where}: prices must map names to strings")
+        if not all(isinstance(v, str) for v in entry.get("fallbacks") or []):
+            problems.append(f"{where}: fallbacks must be strategy names")
+        if isinstance(entry.get("stop_at"), str):
+            try:
+                re.compile(entry["stop_at"])
+            except re.error as e:
+                problems.append(f"{where}: stop_at is not a valid regex ({e})")
+        if isinstance(entry.get("max_bytes"), int) and entry["max_bytes"] <= 0:
+            problems.append(f"{where}: max_bytes must be positive")
+        if entry.get("name") in names:
+            problems.append(f"{where}: duplicate name")
+        names.add(entry.get("name"))
+    return problems
+
+
+def load_restaurants(path=CATALOG_PATH):
+    """Load and validate the restaurant catalog; raises ValueError listing every problem."""
+    with open(path, encoding="utf-8") as f:
+        catalog = json.load(f)
+    problems = validate_catalog(catalog)
+    if problems:
+        raise ValueError(f"invalid restaurant catalog {path}:\n  " + "\n  ".join(problems))
+    return catalog
+
+
+def shard(catalog, index, count):
+    """Entries of shard `index` (1-based) out of `count`, as (catalog position, entry) pairs.
+
+    Entries sharing a URL go to the same shard, so each page is fetched and
+    parsed by one shard only. The URL groups are dealt round-robin in catalog
+    order, so a run of slow neighbours is spread over shards and every shard
+    job, reading the same catalog, splits it the same way.
+    """
+    if not 1 <= index <= count:
+        raise ValueError(f"shard {index}/{count} out of range")
+    groups = {}
+    for i, entry in enumerate(catalog):
+        groups.setdefault(entry["url"], []).append(i)
+    positions = sorted(i for n, group in enumerate(groups.values()) if n % count == index - 1 for i in group)
+    return [(i, catalog[i]) for i in positions]
+
+
+@functools.lru_cache(maxsize=None)
+def default_catalog():
+    """The catalog in restaurants.json, loaded and validated on first use."""
+    return load_restaurants()
@@ -0,0 +1,193 @@
+# server.py
+import argparse
+import hashlib
+import threading
+import time
+from datetime import date
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import delta
+import generate_feed
+from renderers import WRITERS, render_document
+
+REFRESH_INTERVAL = 30 * 60
+
+CONTENT_TYPES = {
+    "xml": "application/xml; charset=utf-8",
+    "rss": "application/rss+xml; charset=utf-8",
+    "json": "application/json; charset=utf-8",
+    "markdown": "text/markdown; charset=utf-8",
+}
+
+
+# -----------------------------------
+# IN-MEMORY FEED
+# -----------------------------------
+
+class FeedStore:
+    """Last good feed, pre-rendered to every output format.
+
+    Requests only read `self.documents` and `self.delta`, which are swapped in
+    one assignment after each refresh, so serving never waits on scraping.
+    `self.delta` holds the sequence cursor and every restaurant's latest
+    change, starting from the saved delta state when there is one.
+    """
+
+    def __init__(self):
+        self.documents = {}
+        self.delta = delta.load_sequences()
+        self.day = None
+        self.last_good = {}
+        self.last_refresh = None
+
+    def refresh(self):
+        day = date.today()
+        if day != self.day:
+            self.last_good = {}
+            self.day = day
+
+        metrics = []
+        feed = generate_feed.build_feed(metrics, day=day)
+        for i, (item, m) in enumerate(zip(feed, metrics)):
+            if m["outcome"] == "error" and item["name"] in self.last_good:
+                print(f"[server] {item['name']}: {m.get('error')}; keeping last good menu")
+                feed[i] = self.last_good[item["name"]]
+            elif m["outcome"] == "ok":
+                self.last_good[item["name"]] = item
+
+        meta = generate_feed.feed_meta(day)
+        self.documents = render_documents(feed, meta)
+        cursor, entries, changed = delta.advance(*self.delta, feed, meta)
+        self.delta = (cursor, entries)
+        if changed:
+            print(f"[server] {len(changed)} menu change(s), delta cursor now {cursor}")
+        self.last_refresh = time.time()
+        weekday = generate_feed.weekday_name(day) or day.strftime("%A")
+        print(f"[server] refreshed {len(feed)} restaurants for {weekday}")
+
+
+def render_documents(feed, meta):
+    """URL path -> (body bytes, ETag, content type) for every writer."""
+    documents = {}
+    rendered = [(writer.path, render_document(writer, feed, meta), writer.format) for writer in WRITERS]
+    filtered = generate_feed.filtered_documents(feed, meta)
+    rendered += [(path, text, fmt) for path, (text, fmt) in filtered.items()]
+    for path, text, fmt in rendered:
+        body = text.encode("utf-8")
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        documents["/" + path] = (body, etag, CONTENT_TYPES[fmt])
+    documents["/"] = documents["/README.md"]
+    return documents
+
+
+DELTA_RENDERERS = {
+    "/" + delta.DELTA_JSON_PATH: (delta.render_json, CONTENT_TYPES["json"]),
+    "/" + delta.DELTA_XML_PATH: (delta.render_xml, CONTENT_TYPES["xml"]),
+}
+
+
+def render_delta(path, query, state):
+    """(body, ETag, content type) of the changes after the ?since= cursor; ValueError for a bad cursor."""
+    render, content_type = DELTA_RENDERERS[path]
+    since = int(parse_qs(query).get("since", ["0"])[-1])
+    body = render(*state, since).encode("utf-8")
+    return body, '"' + hashlib.sha1(body).hexdigest() + '"', content_type
+
+
+def refresh_loop(store, interval, stop):
+    while not stop.wait(interval):
+        try:
+            store.refresh()
+        except Exception as e:
+            print(f"[server] refresh failed, serving previous feed: {e}")
+
+
+# -----------------------------------
+# HTTP
+# -----------------------------------
+
+def make_handler(store):
+    class FeedHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path, _, query = self.path.partition("?")
+            if path == "/healthz":
+                age = time.time() - store.last_refresh if store.last_refresh else -1
+                self._send(200, f'{{"age_seconds": {age:.0f}}}'.encode(), "application/json")
+                return
+            if path in DELTA_RENDERERS:
+                try:
+                    doc = render_delta(path, query, store.delta)
+                except ValueError:
+                    self._send(400, b"since must be an integer sequence number\n", "text/plain; charset=utf-8")
+                    return
+            else:
+                doc = store.documents.get(path)
+            if doc is None:
+                self._send(404, b"Not found\n", "text/plain; charset=utf-8")
+                return
+            body, etag, content_type = doc
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send(200, body, content_type, etag)
+
+        def _send(self, status, body, content_type, etag=None):
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            if etag:
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return FeedHandler
+
+
+def scale_breaker(interval):
+    """Scale the circuit breaker's cool-downs from one run a day to one refresh every `interval` seconds.
+
+    An open circuit then skips as many refreshes as it would skip daily runs,
+    instead of keeping a site out for the rest of the day after an outage of
+    a few refreshes.
+    """
+    health = generate_feed.site_health
+    scale = interval / generate_feed.BREAKER_RUN_INTERVAL
+    health.cooldown = generate_feed.BREAKER_COOLDOWN * scale
+    health.max_cooldown = generate_feed.BREAKER_MAX_COOLDOWN * scale
+
+
+def serve(host, port, interval):
+    scale_breaker(interval)
+    store = FeedStore()
+    store.refresh()
+    stop = threading.Event()
+    threading.Thread(target=refresh_loop, args=(store, interval, stop), daemon=True).start()
+    httpd = ThreadingHTTPServer((host, port), make_handler(store))
+    print(f"[server] serving {', '.join(sorted([*store.documents, *DELTA_RENDERERS]))} on http://{host}:{port}")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop.set()
+        httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the lunch feed from memory with scheduled refresh.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--interval", type=int, default=REFRESH_INTERVAL, help="seconds between refreshes")
+    args = parser.parse_args()
+    serve(args.host, args.port, args.interval)
+
+
+if __name__ == "__main__":
+    main()